@@ -0,0 +1,76 @@
+"""
+Import-time benchmark for the src package.
+
+Each module is imported in a fresh interpreter with `python -X importtime` and the
+cumulative time of its top-level import is read from the report (best of --repeat
+runs). The run fails (exit code 1) if a module is over its budget in thresholds.json
+("imports", in ms) or if importing it pulls in a dependency listed under "lazy".
+
+Usage:
+    python benchmarks/bench_import.py
+    python benchmarks/bench_import.py src.utils --repeat 10
+"""
+import sys
+import json
+import argparse
+import subprocess
+from pathlib import Path
+
+here = Path(__file__).resolve().parent
+
+
+def import_time(module, repeat=5):
+    """Best cumulative import time of module in a fresh interpreter (seconds)"""
+    times = []
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            capture_output=True, text=True, check=True,
+        )
+        # "import time: self [us] | cumulative | imported package", one line per module
+        for line in out.stderr.splitlines():
+            fields = [f.strip() for f in line.split("|")]
+            if len(fields) == 3 and fields[2] == module:
+                times.append(int(fields[1]) / 1e6)
+    return min(times)
+
+
+def loaded(module, names):
+    """Which of names are in sys.modules after importing module in a fresh interpreter"""
+    code = f"import sys, {module}; print(' '.join(m for m in {list(names)!r} if m in sys.modules))"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return out.stdout.split()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modules", nargs="*", help="modules to time (default: all with a budget)")
+    parser.add_argument("--repeat", type=int, default=5, help="timing repeats (best is kept)")
+    parser.add_argument("--thresholds", type=Path, default=here / "thresholds.json", help="import budgets")
+    args = parser.parse_args(argv)
+
+    with open(args.thresholds) as f:
+        thresholds = json.load(f)
+    budgets = thresholds.get("imports", {})
+    lazy = thresholds.get("lazy", [])
+
+    failed = []
+    for module in args.modules or budgets:
+        ms = import_time(module, repeat=args.repeat) * 1e3
+        heavy = loaded(module, lazy)
+        budget = budgets.get(module)
+        over = budget is not None and ms > budget
+        flag = ("OVER BUDGET " if over else "") + (f"loads {', '.join(heavy)}" if heavy else "")
+        limit = f"(budget {budget} ms)" if budget is not None else ""
+        print(f"{module:20s} {ms:8.1f} ms {limit:18s} {flag}")
+        if over or heavy:
+            failed.append(module)
+
+    if failed:
+        print(f"{len(failed)} module(s) failed: {', '.join(failed)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
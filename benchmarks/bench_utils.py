@@ -0,0 +1,258 @@
+"""
+Benchmarks for the hot paths in src.utils.
+
+Each benchmark is timed at the sizes we run in practice: one country (49 years), all
+countries (200 x 49) and a subnational monthly set (20k series x 600 months, batch
+functions only). Data is synthetic (src.synthetic) apart from get_datafiles, which
+reads the cleaned files in the repo, so the suite runs offline.
+
+Usage:
+    python benchmarks/bench_utils.py                         # run, write results/latest.json
+    python benchmarks/bench_utils.py --save-baseline         # also store as results/baseline.json
+    python benchmarks/bench_utils.py --compare results/baseline.json
+
+With --compare the run fails (exit code 1) if any benchmark is slower than the
+baseline by more than the ratio configured in thresholds.json.
+"""
+import sys
+import json
+import time
+import timeit
+import argparse
+import platform
+import importlib.util
+from pathlib import Path
+
+import numpy as np
+
+from src import utils
+from src.synthetic import synthetic_series, synthetic_dataframes, synthetic_panel
+
+here = Path(__file__).resolve().parent
+results_dir = here / "results"
+
+# name -> setup function returning the callable to time
+BENCHMARKS = {}
+
+# benchmark sizes: (locations, periods, periods per year)
+SIZES = {
+    "country": (1, 49, 1),
+    "countries": (200, 49, 1),
+    "subnational": (20_000, 600, 12),
+}
+
+
+def benchmark(name):
+    """Register a setup function under name"""
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def _data(size):
+    n, nt, ppy = SIZES[size]
+    return synthetic_series(n, nt, ppy=ppy, seed=1)
+
+
+@benchmark("calc_weights[n=49]")
+def _():
+    def run():
+        utils.clear_kernel_cache()
+        utils.calc_weights(49)
+    return run
+
+
+@benchmark("calc_wcv[n=10]")
+def _():
+    cases, _, _ = _data("country")
+    w = np.ones(10)
+    return lambda: utils.calc_wcv(cases[0, :10], w)
+
+
+for _size in ("country", "countries"):
+
+    @benchmark(f"calc_wmi[{_size}]")
+    def _(size=_size):
+        cases, pop, t = _data(size)
+        return lambda: [utils.calc_wmi(c, p, t, start_year=t[0]) for c, p in zip(cases, pop)]
+
+    @benchmark(f"calc_lcv[{_size}]")
+    def _(size=_size):
+        cases, _, t = _data(size)
+        return lambda: [utils.calc_lcv(c, t) for c in cases]
+
+    @benchmark(f"calc_cv[{_size}]")
+    def _(size=_size):
+        cases, _, t = _data(size)
+        return lambda: [utils.calc_cv(c, t) for c in cases]
+
+
+for _size in ("countries", "subnational"):
+
+    @benchmark(f"calc_wmi_batch[{_size}]")
+    def _(size=_size):
+        cases, pop, t = _data(size)
+        ppy = SIZES[size][2]
+        return lambda: utils.calc_wmi_batch(cases, pop, t, start_year=t[0], ppy=ppy)
+
+    @benchmark(f"calc_lcv_batch[{_size}]")
+    def _(size=_size):
+        cases, _, t = _data(size)
+        ppy = SIZES[size][2]
+        return lambda: utils.calc_lcv_batch(cases, t, ny=10*ppy)
+
+    @benchmark(f"calc_cv_batch[{_size}]")
+    def _(size=_size):
+        cases, _, t = _data(size)
+        ppy = SIZES[size][2]
+        return lambda: utils.calc_cv_batch(cases, t, ppy=ppy)
+
+    @benchmark(f"calc_canonical_path[{_size}]")
+    def _(size=_size):
+        cases, pop, t = _data(size)
+        ppy = SIZES[size][2]
+        return lambda: utils.calc_canonical_path(cases, pop, t, ppy=ppy)
+
+    @benchmark(f"calc_canonical_path[{_size},float32]")
+    def _(size=_size):
+        cases, pop, t = _data(size)
+        ppy = SIZES[size][2]
+
+        def run():
+            dtype = utils.get_dtype()
+            utils.set_dtype("float32")
+            try:
+                utils.calc_canonical_path(cases, pop, t, ppy=ppy)
+            finally:
+                utils.set_dtype(dtype)
+        return run
+
+
+# compiled backend, when numba is installed (see utils.set_backend)
+if importlib.util.find_spec("numba") is not None:
+    for _size in ("countries", "subnational"):
+
+        @benchmark(f"calc_canonical_path[{_size},numba]")
+        def _(size=_size):
+            cases, pop, t = _data(size)
+            ppy = SIZES[size][2]
+
+            def run():
+                backend = utils.get_backend()
+                utils.set_backend("numba")
+                try:
+                    utils.calc_canonical_path(cases, pop, t, ppy=ppy)
+                finally:
+                    utils.set_backend(backend)
+            return run
+
+
+# nearest paths (similarity.make_tree: cKDTree, or KDTree without scipy), 100
+# queries against the embeddings (2 * 10 dimensions) of every location
+for _size in ("countries", "subnational"):
+
+    @benchmark(f"make_tree.query[{_size}]")
+    def _(size=_size):
+        from src.similarity import make_tree
+
+        vectors = np.random.default_rng(1).normal(size=(SIZES[size][0], 20))
+        return lambda: make_tree(vectors).query(vectors[:100], k=6)
+
+
+@benchmark("get_cases_pop[dataframe]")
+def _():
+    inc_df, pop_df = synthetic_dataframes(200, 49)
+    years = np.arange(1980, 2019)
+    return lambda: utils.get_cases_pop("S000100", inc_df, pop_df, year=years)
+
+
+@benchmark("get_cases_pop[panel]")
+def _():
+    panel = synthetic_panel(200, 49)
+    years = np.arange(1980, 2019)
+    return lambda: utils.get_cases_pop("S000100", panel, year=years)
+
+
+@benchmark("get_datafiles")
+def _():
+    sys.path.insert(0, str(here.parent / "scripts"))
+    from settings import Settings
+    return lambda: utils.get_datafiles(cases=Settings.cases, population=Settings.population)
+
+
+def time_it(fn, repeat=5, min_time=0.2):
+    """Best time per call (seconds) over repeat runs of at least min_time each"""
+    timer = timeit.Timer(fn)
+    number = 1
+    while True:
+        if timer.timeit(number) >= min_time or number >= 1_000_000:
+            break
+        number *= 10
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def run(pattern="", repeat=5, min_time=0.2):
+    """Time the benchmarks whose name contains pattern, returns name -> seconds per call"""
+    results = {}
+    for name, setup in BENCHMARKS.items():
+        if pattern not in name:
+            continue
+        results[name] = time_it(setup(), repeat=repeat, min_time=min_time)
+        print(f"{name:40s} {results[name]*1e3:12.4f} ms", flush=True)
+    return results
+
+
+def compare(results, baseline, thresholds):
+    """Names of benchmarks slower than baseline by more than their threshold ratio"""
+    failed = []
+    for name, seconds in results.items():
+        if name not in baseline:
+            continue
+        ratio = seconds / baseline[name]
+        limit = thresholds.get("benchmarks", {}).get(name, thresholds.get("default", 1.5))
+        flag = "REGRESSION" if ratio > limit else ""
+        print(f"{name:40s} x{ratio:6.2f} (limit x{limit:.2f}) {flag}")
+        if ratio > limit:
+            failed.append(name)
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-k", "--filter", default="", help="only run benchmarks whose name contains this")
+    parser.add_argument("--repeat", type=int, default=5, help="timing repeats (best is kept)")
+    parser.add_argument("--output", type=Path, default=results_dir / "latest.json", help="results file")
+    parser.add_argument("--compare", type=Path, help="baseline results file to check against")
+    parser.add_argument("--thresholds", type=Path, default=here / "thresholds.json", help="regression ratios")
+    parser.add_argument("--save-baseline", action="store_true", help="also write results/baseline.json")
+    args = parser.parse_args(argv)
+
+    results = run(args.filter, repeat=args.repeat)
+    record = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "results": results,
+    }
+    outputs = [args.output] + ([results_dir / "baseline.json"] if args.save_baseline else [])
+    for output in outputs:
+        output.parent.mkdir(parents=True, exist_ok=True)
+        with open(output, "w") as f:
+            json.dump(record, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        with open(args.thresholds) as f:
+            thresholds = json.load(f)
+        failed = compare(results, baseline, thresholds)
+        if failed:
+            print(f"{len(failed)} benchmark(s) regressed: {', '.join(failed)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+"""
+Build the figures (Fig1, S1, S2, S3) in one go, like make.
+
+The panel is loaded once, the canonical path each figure needs (its PATH_YEARS) is
+computed once and shared, and the figures are drawn in parallel worker processes.
+A figure is skipped when its output exists and nothing it depends on has changed
+since the last build: the cleaned data files, the figure script, settings.py, the
+src package, the path parameters and the dtype and backend (CPT_DTYPE, CPT_BACKEND).
+The hashes are kept in figures/build_manifest.json, by path relative to the repo.
+
+Usage:
+    python build.py                 # build out-of-date figures
+    python build.py S1 S3 --force   # rebuild S1 and S3
+"""
+import sys
+import json
+import hashlib
+import argparse
+import importlib
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from settings import Settings
+
+from src import paths
+from src import utils
+from src import timing
+from src.panel import load_panel, _source_info
+from src.canonical import canonical_path
+
+# figure scripts, each with PATH_YEARS and main(panel=None, path=None)
+FIGURES = ("Fig1", "S1", "S2", "S3")
+
+manifest_file = Path(paths.figures) / "build_manifest.json"
+
+# panel and shared paths of each worker process (see _init_worker)
+_panel = None
+_paths = None
+
+
+def _sources(names):
+    """Files the figures depend on, beyond their own script"""
+    files = [
+        paths.cleaned_file(Settings.cases),
+        paths.cleaned_file(Settings.population),
+        Path(paths.scripts) / "settings.py",
+        *sorted((Path(paths.root) / "src" / "src").glob("*.py")),
+    ]
+    return files + [Path(paths.scripts) / f"{name}.py" for name in names]
+
+
+def _name(filename):
+    """Manifest key of a file: its path relative to the repo, so the manifest is portable"""
+    return Path(filename).resolve().relative_to(Path(paths.root).resolve()).as_posix()
+
+
+def figure_key(name, module, sources):
+    """Hash of everything figure name depends on (sources maps _name(file) -> _source_info)"""
+    deps = {
+        "data": [sources[_name(f)]["sha256"] for f in _sources([])],
+        "script": sources[_name(Path(paths.scripts) / f"{name}.py")]["sha256"],
+        "params": {"path_years": list(module.PATH_YEARS)},
+        # a float32 or numba build is not the same figure as a float64 one
+        "policy": {"dtype": utils.get_dtype(), "backend": utils.get_backend()},
+    }
+    return hashlib.sha256(json.dumps(deps, sort_keys=True).encode()).hexdigest()
+
+
+def _init_worker(panel, shared):
+    """Keep the panel and shared paths in the worker and draw off-screen"""
+    global _panel, _paths
+    import matplotlib
+    matplotlib.use("Agg")
+    _panel, _paths = panel, shared
+
+
+def _draw(name, path_years):
+    import matplotlib.pyplot as plt
+    plt.close("all")
+    # figures share the worker, so keep each one's rcParams (e.g. Fig1's font size) to itself
+    with plt.rc_context():
+        importlib.import_module(name).main(panel=_panel, path=_paths[path_years])
+    plt.close("all")
+    return name
+
+
+def build(names=FIGURES, force=False, max_workers=None):
+    """Build the figures in names that are out of date.
+
+    Args:
+        names (tuple, optional): Figure scripts to consider. Defaults to FIGURES.
+        force (bool, optional): Rebuild even if up to date. Defaults to False.
+        max_workers (int, optional): Number of worker processes. Defaults to os.cpu_count().
+
+    Returns:
+        tuple: Names of the figures that were built, and of those that were out of date.
+    """
+    manifest = {"sources": {}, "figures": {}}
+    if manifest_file.exists():
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+
+    sources = {
+        _name(f): _source_info(f, manifest["sources"].get(_name(f)))
+        for f in _sources(names)
+    }
+    modules = {name: importlib.import_module(name) for name in names}
+    keys = {name: figure_key(name, module, sources) for name, module in modules.items()}
+
+    todo = [
+        name for name in names
+        if force
+        or manifest["figures"].get(name) != keys[name]
+        or not (Path(paths.figures) / f"{name}.png").exists()
+    ]
+    for name in names:
+        if name not in todo:
+            print(f"{name}: up to date")
+    if not todo:
+        return [], []
+
+    # load the data and compute each distinct path once
+    panel = load_panel(cases=Settings.cases, population=Settings.population)
+    shared = {}
+    with timing.timer("canonical_path"):
+        for name in todo:
+            path_years = tuple(modules[name].PATH_YEARS)
+            if path_years not in shared:
+                shared[path_years] = canonical_path(panel, year=np.arange(*path_years))
+
+    Path(paths.figures).mkdir(parents=True, exist_ok=True)
+    with timing.timer("figures"):
+        with ProcessPoolExecutor(max_workers, initializer=_init_worker, initargs=(panel, shared)) as pool:
+            futures = {name: pool.submit(_draw, name, tuple(modules[name].PATH_YEARS)) for name in todo}
+            built = []
+            for name, future in futures.items():
+                try:
+                    built.append(future.result())
+                    print(f"{name}: built")
+                except Exception as e:
+                    print(f"{name}: failed ({e!r})")
+
+    # only record figures that were built
+    manifest["sources"].update(sources)
+    manifest["figures"].update({name: keys[name] for name in built})
+    with open(manifest_file, "w") as f:
+        json.dump(manifest, f, indent=1)
+
+    return built, todo
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("figures", nargs="*", default=list(FIGURES), help="figures to build")
+    parser.add_argument("--force", action="store_true", help="rebuild even if up to date")
+    parser.add_argument("-j", "--jobs", type=int, help="worker processes (default: one per CPU)")
+    args = parser.parse_args(argv)
+
+    built, todo = build(args.figures, force=args.force, max_workers=args.jobs)
+    return 0 if len(built) == len(todo) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
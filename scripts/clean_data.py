@@ -1,3 +1,5 @@
+import calendar
+
 import pandas as pd
 import numpy as np
 
@@ -12,41 +14,103 @@ Both the population and case data should be a country time series per row.
 
 from settings import Settings
 
-def clean_incidence(filename, years):
-    data = pd.read_csv(f"{paths.data}/{filename}")
+# rows per chunk when streaming the raw files
+CHUNKSIZE = 100_000
+
+def clean_incidence(filename, years, chunksize=CHUNKSIZE):
+    """Clean the WHO long-format incidence (one row per country and year).
 
+    The raw file is streamed in chunks, reading only the needed columns, and the
+    (country, year) mean that pivot_table would take is accumulated as sums and
+    counts, so peak memory scales with the cleaned table rather than the raw one.
+    """
     # Rename columns now
     col_map = {
         "Value": DataNames.cases,
         "SpatialDimValueCode": DataNames.iso,
         "Period": DataNames.year,
         "ParentLocationCode": DataNames.region,
-        "Location": DataNames.country
+    }
+    dtype = {"Value": "float64", "SpatialDimValueCode": "str", "ParentLocationCode": "str"}
+    keys = [DataNames.iso, DataNames.region, DataNames.year]
+
+    totals = None
+    seen = set()
+    reader = pd.read_csv(
+        f"{paths.data}/{filename}", usecols=list(col_map), dtype=dtype, chunksize=chunksize
+    )
+    for chunk in reader:
+        chunk.rename(mapper=col_map, axis=1, inplace=True)
+        agg = chunk.groupby(keys)[DataNames.cases].agg(["sum", "count"])
+
+        # locations with any data are kept, even if none of it is in the year range (as pivot_table)
+        reported = agg["count"] > 0
+        seen.update(zip(agg.index.get_level_values(0)[reported], agg.index.get_level_values(1)[reported]))
+
+        # drop years not in the range indicated by years
+        year = agg.index.get_level_values(DataNames.year)
+        agg = agg[(year >= years[0]) & (year <= years[1])]
+        totals = agg if totals is None else totals.add(agg, fill_value=0)
+
+    # pivot on year: mean of the reports for each (country, year); the chunks add years
+    # in the order they arrive, so put the year columns back in order
+    data = (totals["sum"] / totals["count"].where(totals["count"] > 0)).unstack(DataNames.year)
+    data = data.sort_index(axis=1)
+    data = data.reindex(index=sorted(seen)).dropna(axis=1, how="all")
+    data.index.names = keys[:2]
+    data.columns.name = None
+    data = data.reset_index()
+
+    # save file
+    data.to_csv(paths.cleaned_file(filename), index=False)
+
+def clean_incidence_monthly(filename, years):
+    """Clean the WHO provisional monthly data (one row per country and year, one column per month).
+
+    The cleaned file (paths.cleaned_file) has one "YYYY-MM" column per month, and loads
+    with load_panel(Settings.monthly_cases, Settings.population, ppy=12).
+    """
+    data = pd.read_excel(f"{paths.data}/{filename}", sheet_name="WEB")
+
+    # Rename columns now
+    col_map = {
+        "ISO3": DataNames.iso,
+        "Region": DataNames.region,
+        "Year": DataNames.year,
     }
     data.rename(mapper=col_map, axis=1, inplace=True)
-    # drop other columns
-    drop_cols = [c for c in data.columns if c not in col_map.values()]
-    data.drop(drop_cols, axis=1, inplace=True)
 
-    # pivot on year
+    # one row per (country, year, month)
+    months = {name: ix for ix, name in enumerate(calendar.month_name) if name}
+    data = data.melt(
+        id_vars=list(col_map.values()),
+        value_vars=[m for m in months if m in data.columns],
+        var_name=DataNames.month,
+        value_name=DataNames.cases,
+    )
+
+    # drop years not in the range indicated by years
+    data = data[(data[DataNames.year] >= years[0]) & (data[DataNames.year] <= years[1])]
+
+    # pivot on (year, month)
+    data[DataNames.month] = [
+        f"{int(y)}-{months[m]:02d}" for y, m in zip(data[DataNames.year], data[DataNames.month])
+    ]
     data = data.pivot_table(
         index=[DataNames.iso, DataNames.region],
-        columns=DataNames.year,
+        columns=DataNames.month,
         values=DataNames.cases,
         fill_value=np.nan,
     ).reset_index()
 
-    # drop years not in the range indicated by yeras
-    year_range = [y for y in range(years[0], years[1]+1)]
-    drop_years = [y for y in data.columns if y not in year_range]
-    drop_years = [y for y in drop_years if y not in col_map.values()]
-    data.drop(drop_years, axis=1, inplace=True)
-
     # save file
-    data.to_csv(f"{paths.data}/{DataNames.cleaned}_{filename}", index=False)
+    data.to_csv(paths.cleaned_file(filename), index=False)
+
+def clean_population(filename, years, chunksize=CHUNKSIZE):
+    """Clean the World Bank wide-format population (one row per country, one column per year).
 
-def clean_population(filename, years):
-    data = pd.read_csv(f"{paths.data}/{filename}", header=2)
+    Only the name, code and in-range year columns are read, in chunks.
+    """
     # rename columns
     col_map = {
         "Country Name": DataNames.country,
@@ -54,19 +118,24 @@ def clean_population(filename, years):
         }
     for y in range(years[0], years[1]+1):
         col_map[str(y)] = y
-    data.rename(mapper=col_map, axis=1, inplace=True)
 
-   # drop years not in the range indicated by yeras
-    year_range = [y for y in range(years[0], years[1]+1)]
-    drop_years = [y for y in data.columns if y not in year_range]
-    drop_years = [y for y in drop_years if y not in col_map.values()]
-    data.drop(drop_years, axis=1, inplace=True)
+    # only read the columns we keep (years not in the range indicated by years are skipped)
+    header = pd.read_csv(f"{paths.data}/{filename}", header=2, nrows=0).columns
+    usecols = [c for c in header if c in col_map]
+    dtype = {c: ("str" if c in ("Country Name", "Country Code") else "float64") for c in usecols}
+
+    reader = pd.read_csv(
+        f"{paths.data}/{filename}", header=2, usecols=usecols, dtype=dtype, chunksize=chunksize
+    )
+    data = pd.concat(reader, ignore_index=True)
+    data.rename(mapper=col_map, axis=1, inplace=True)
 
     # save file
-    data.to_csv(f"{paths.data}/{DataNames.cleaned}_{filename}", index=False)    
+    data.to_csv(paths.cleaned_file(filename), index=False)
 
 
 if __name__ == "__main__":
-    # clean_incidence(Settings.cases, Settings.years)
+    clean_incidence(Settings.cases, Settings.years)
+    clean_incidence_monthly(Settings.monthly_cases, Settings.years)
     clean_population(Settings.population, Settings.years)
     print("done")
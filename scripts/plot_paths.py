@@ -0,0 +1,60 @@
+"""
+Canonical paths of every country (or a region) as pages of small multiples.
+
+The fast counterpart of S3 for many locations: see src.render.
+
+    python plot_paths.py --region AFR --shape 4 4 --workers 4 --format pdf
+"""
+import argparse
+
+import numpy as np
+
+from settings import Settings
+
+from src import paths
+from src import timing
+from src import render
+from src.panel import load_panel
+from src.canonical import canonical_path
+
+# years of the canonical path (end exclusive)
+PATH_YEARS = (1974, 2023)
+
+
+def transform(x):
+    """ Non-linear transform for y-axis """
+    return np.cbrt(x)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--region", help="only countries in this region")
+    parser.add_argument("--shape", type=int, nargs=2, default=(6, 6), help="rows and columns per page")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument("--format", default="png", help="output format (png, pdf, svg)")
+    parser.add_argument("--no-rasterize", action="store_true", help="keep vector trajectories")
+    args = parser.parse_args(argv)
+
+    panel = load_panel(cases=Settings.cases, population=Settings.population)
+    with timing.timer("canonical_path"):
+        path, t = canonical_path(panel, year=np.arange(*PATH_YEARS))
+
+    rows = panel.region_index[args.region] if args.region else np.arange(len(panel))
+    name = f"paths_{args.region}" if args.region else "paths"
+    with timing.timer("render"):
+        files = render.small_multiples(
+            path[rows, :, 0],
+            transform(path[rows, :, 1]),
+            f"{paths.figures}/{name}_{{page:03d}}.{args.format}",
+            titles=panel.isos[rows],
+            shape=tuple(args.shape),
+            max_workers=args.workers,
+            xlim=(0, 4),
+            ylim=(transform(1), transform(4000)),
+            rasterized=not args.no_rasterize,
+        )
+    print(f"wrote {len(files)} page(s) to {paths.figures}")
+
+
+if __name__ == "__main__":
+    main()
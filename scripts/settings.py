@@ -1,7 +1,7 @@
 # Scripts settings, put data file names here
-import sciris as sc
 
-class Settings(sc.prettyobj):
+class Settings:
     cases: str = 'measlescasedata.csv'
+    monthly_cases: str = 'measlescasesbycountrybymonth.xlsx'
     population: str = 'API_SP.POP.TOTL_DS2_en_csv_v2_84031.csv'
     years: list = [1974, 2022] # [start, end] years
@@ -0,0 +1,48 @@
+"""
+Compute the canonical path of every country and write it to the results store.
+
+Each (ny, s) pair is one parameter set in the store (see src.store); running again
+with the same parameters replaces their rows.
+
+    python write_results.py --ny 10 --s 3 4
+    python write_results.py --query AFR 2014 1
+"""
+import argparse
+
+import numpy as np
+
+from settings import Settings
+
+from src import timing
+from src.panel import load_panel
+from src.store import ResultsStore
+
+# years of the canonical path (end exclusive)
+PATH_YEARS = (1974, 2023)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--store", help="store folder (default: data/results)")
+    parser.add_argument("--ny", type=int, nargs="+", default=[10], help="CV window(s) in years")
+    parser.add_argument("--s", type=float, nargs="+", default=[3], help="smoothing width(s) in years")
+    parser.add_argument("--query", nargs=3, metavar=("REGION", "YEAR", "CV"),
+                        help="print the countries of REGION with CV > CV in YEAR instead")
+    args = parser.parse_args(argv)
+
+    store = ResultsStore(args.store)
+    if args.query:
+        region, year, cv = args.query
+        print(store.query(region=region, year=float(year), where=[("cv", ">", float(cv))]).to_string())
+        return
+
+    panel = load_panel(cases=Settings.cases, population=Settings.population)
+    for ny in args.ny:
+        for s in args.s:
+            with timing.timer("write_path"):
+                store.write_path(panel, year=np.arange(*PATH_YEARS), ny=ny, s=s)
+    print(store)
+
+
+if __name__ == "__main__":
+    main()
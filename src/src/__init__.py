@@ -0,0 +1,39 @@
+"""
+Canonical path tools.
+
+Submodules are imported on first use (e.g. `import src; src.utils`), so importing the
+package, or a light submodule such as src.paths, does not pull in numpy or pandas.
+Heavy optional dependencies (pandas, pycountry, matplotlib) are imported inside the
+functions that need them.
+"""
+import importlib
+
+__all__ = [
+    "canonical",
+    "countries",
+    "cube",
+    "incremental",
+    "panel",
+    "paths",
+    "render",
+    "similarity",
+    "sources",
+    "standards",
+    "store",
+    "subnational",
+    "sweep",
+    "synthetic",
+    "timing",
+    "uncertainty",
+    "utils",
+]
+
+
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,85 @@
+"""
+Compiled kernels for the "numba" backend of src.utils (see utils.set_backend).
+
+Each kernel works on 2-D (rows, time) float64 arrays and runs the rows in parallel.
+They follow the arithmetic of the NumPy batch engines: the local CV sums windows in
+the same order (so results match exactly) and the Gaussian smoothing skips the zero
+upper triangle of the weight matrix (results match to rounding).
+
+Importing this module requires numba.
+"""
+import os
+
+import numpy as np
+from numba import config, njit, prange
+
+# the scripts fork process pools (sweep, build, uncertainty), and a child forked after
+# numba has started TBB threads hangs on exit, so use the workqueue layer (fork safe, no
+# extra libraries) unless the caller chose a layer
+if config.THREADING_LAYER == "default" and "NUMBA_THREADING_LAYER" not in os.environ:
+    config.THREADING_LAYER = "workqueue"
+
+
+@njit(parallel=True, cache=True)
+def lcv(x, ny):
+    """Local CV of each row over windows of ny points (see utils.calc_lcv_batch)"""
+    n, nx = x.shape
+    nw = nx - ny + 1
+    out = np.zeros((n, nw))
+    for r in prange(n):
+        for k in range(nw):
+            wm = 0.0
+            for ix in range(ny):
+                wm += x[r, k + ix]
+            wm /= ny
+            num = 0.0
+            for ix in range(ny):
+                num += (x[r, k + ix] - wm) ** 2
+            if wm > 0:
+                out[r, k] = np.sqrt(num / ny) / wm
+    return out
+
+
+@njit(parallel=True, cache=True)
+def smooth(x, W, norm):
+    """Growing-kernel weighted mean of each row: (x @ W.T) / norm for lower-triangular W"""
+    n, nt = x.shape
+    out = np.empty((n, nt))
+    for r in prange(n):
+        for k in range(nt):
+            acc = 0.0
+            for j in range(k + 1):
+                acc += W[k, j] * x[r, j]
+            out[r, k] = acc / norm[k]
+    return out
+
+
+@njit(parallel=True, cache=True)
+def wmi(cases, pop, W, norm, scale):
+    """Weighted mean incidence of each row; non-finite incidence carries on as in utils.carry_nonfinite"""
+    n, nt = cases.shape
+    out = np.empty((n, nt))
+    for r in prange(n):
+        inc = cases[r] / pop[r]
+        up = False
+        down = False
+        nan = False
+        for k in range(nt):
+            if np.isnan(inc[k]):
+                nan = True
+            elif inc[k] == np.inf:
+                up = True
+            elif inc[k] == -np.inf:
+                down = True
+            if nan or (up and down):
+                out[r, k] = np.nan
+            elif up:
+                out[r, k] = np.inf
+            elif down:
+                out[r, k] = -np.inf
+            else:
+                acc = 0.0
+                for j in range(k + 1):
+                    acc += W[k, j] * inc[j]
+                out[r, k] = scale * acc / norm[k]
+    return out
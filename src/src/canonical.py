@@ -0,0 +1,57 @@
+"""
+Canonical path (CV and mean incidence trajectories) for every location in a Panel.
+"""
+import numpy as np
+
+from src import utils
+from src.standards import DataNames
+
+
+def canonical_path(panel, year=None, ny=10, pop_norm=100000, s=3, dx=2):
+    """Calculate the canonical path of every location in the panel at once.
+
+    Args:
+        panel (Panel): Cases and population.
+        year (array, optional): Contiguous years (or periods, see Panel.ppy) to use, the
+            first one is the start of both calculations. Defaults to all years in the panel.
+        ny (int, optional): Local CV window length in years. Defaults to 10.
+        pop_norm (int, optional): The normalization factor for the population. Defaults to 100000.
+        s (float, optional): Width of the Gaussian kernels. Defaults to 3.
+        dx (float, optional): Offset of the incidence kernel. Defaults to 2.
+
+    Returns:
+        tuple: path, shape (locations, years, 2) with CV in [..., 0] and mean incidence
+        in [..., 1], and the years of the path.
+    """
+    year = panel.years if year is None else np.asarray(year)
+    cols = panel.columns(year)
+    cv, mi, t = utils.calc_canonical_path(
+        panel.cases[:, cols], panel.pop[:, cols], year, ny=ny, pop_norm=pop_norm, s=s, dx=dx,
+        ppy=panel.ppy,
+    )
+    return np.stack([cv, mi], axis=-1), t
+
+
+def canonical_path_table(panel, year=None, ny=10, pop_norm=100000, s=3, dx=2):
+    """Canonical path of every location as a long-format table.
+
+    Same arguments as canonical_path.
+
+    Returns:
+        DataFrame: One row per (location, year) with the panel's label columns (iso3,
+        country, region) and year, cv and mi columns.
+    """
+    return path_table(panel, *canonical_path(panel, year=year, ny=ny, pop_norm=pop_norm, s=s, dx=dx))
+
+
+def path_table(panel, path, t):
+    """Long-format table of a path returned by canonical_path for the same panel"""
+    import pandas as pd
+
+    n, nt = path.shape[:2]
+    return pd.DataFrame({
+        **{name: np.repeat(values, nt) for name, values in panel.labels().items()},
+        DataNames.year: np.tile(t, n),
+        DataNames.cv: path[..., 0].ravel(),
+        DataNames.mi: path[..., 1].ravel(),
+    })
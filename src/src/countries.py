@@ -0,0 +1,77 @@
+"""
+Country name -> ISO3 resolution without a fuzzy search on every call.
+
+A CountryResolver holds a dictionary of known names (e.g. the country column of the
+cleaned population data) and remembers every answer. pycountry is only imported, and
+its fuzzy search only run, for names it has not seen before.
+"""
+import json
+
+
+def _key(name):
+    """Normalized lookup key for a country name"""
+    return " ".join(str(name).casefold().split())
+
+
+class CountryResolver:
+    """Memoized country name (or alias) -> ISO3 lookup.
+
+    Args:
+        names (dict, optional): Known name -> ISO3 code pairs.
+    """
+
+    def __init__(self, names=None):
+        self.names = {}
+        for name, iso in (names or {}).items():
+            self.add(name, iso)
+
+    @classmethod
+    def from_names(cls, names, isos):
+        """Resolver seeded with matching sequences of names and ISO3 codes"""
+        resolver = cls()
+        for name, iso in zip(names, isos):
+            resolver.add(name, iso)
+        return resolver
+
+    @classmethod
+    def from_panel(cls, panel):
+        """Resolver seeded with the country names and ISO3 codes of a Panel"""
+        return cls.from_names(panel.countries, panel.isos)
+
+    @classmethod
+    def load(cls, filename):
+        """Resolver from a JSON file written by save"""
+        with open(filename) as f:
+            return cls(json.load(f))
+
+    def save(self, filename):
+        """Write the known names (including memoized lookups) to a JSON file"""
+        with open(filename, "w") as f:
+            json.dump(self.names, f, indent=1, sort_keys=True)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return _key(name) in self.names
+
+    def add(self, name, iso):
+        """Register a name (or alias) for an ISO3 code; codes also resolve to themselves"""
+        if isinstance(name, str) and isinstance(iso, str):
+            self.names[_key(name)] = iso
+            self.names.setdefault(_key(iso), iso)
+
+    def resolve(self, country):
+        """ISO3 code of a country name, falling back to pycountry's fuzzy search"""
+        key = _key(country)
+        if key not in self.names:
+            import pycountry
+
+            self.names[key] = pycountry.countries.search_fuzzy(country)[0].alpha_3
+        return self.names[key]
+
+    __getitem__ = resolve
+
+
+# resolver shared by utils.get_country_code
+default_resolver = CountryResolver()
@@ -0,0 +1,209 @@
+"""
+Region x year aggregates of a Panel and its canonical path.
+
+A RegionCube is computed once from the per-country arrays with grouped reductions
+(rows sorted by region, then np.add.reduceat), and answers (region, year range)
+queries from the aggregates alone: reported cases and population sums, the
+population-weighted mean incidence (WMI) and CV, and quantiles of both across the
+countries of each region. A "Global" row aggregates all countries. load_cube keeps
+the cube in the data cache so it is only computed when the panel or parameters change.
+"""
+import os
+import json
+import hashlib
+import tempfile
+import warnings
+from pathlib import Path
+
+import numpy as np
+
+from src import paths
+from src.panel import CACHE_DIR
+from src.canonical import canonical_path
+from src.standards import DataNames
+
+# name of the row aggregating all countries
+GLOBAL = "Global"
+
+
+def _grouped(x, order, starts):
+    """Sum of the rows of x in each group, ignoring NaN (rows sorted by group start at starts)"""
+    x = np.where(np.isfinite(x), x, 0)
+    return np.add.reduceat(x[order], starts, axis=0)
+
+
+class RegionCube:
+    """Region x year aggregates of reported cases, population and the canonical path.
+
+    Args:
+        regions (array): Region names, the last one GLOBAL.
+        years (array): Years of the canonical path.
+        quantiles (array): Quantiles across countries.
+        values (dict): Measure name -> array of shape (regions, years), or (regions,
+            years, quantiles) for the "<measure>_q" quantile measures.
+        params (dict, optional): Parameters the cube was built with.
+    """
+
+    def __init__(self, regions, years, quantiles, values, params=None):
+        self.regions = np.asarray(regions, dtype=object)
+        self.years = np.asarray(years)
+        self.quantiles = np.asarray(quantiles, dtype=float)
+        self.values = values
+        self.params = params or {}
+        self.region_index = {region: ix for ix, region in enumerate(self.regions)}
+
+    @classmethod
+    def from_panel(cls, panel, year=None, quantiles=(0.1, 0.5, 0.9), ny=10, pop_norm=100000, s=3, dx=2):
+        """Build the cube from a panel.
+
+        Args:
+            panel (Panel): Cases and population, with regions.
+            year (array, optional): Contiguous years to use, as in canonical.canonical_path.
+            quantiles (tuple, optional): Quantiles across countries. Defaults to (0.1, 0.5, 0.9).
+            ny, pop_norm, s, dx: As in canonical.canonical_path.
+
+        Returns:
+            RegionCube
+        """
+        path, t = canonical_path(panel, year=year, ny=ny, pop_norm=pop_norm, s=s, dx=dx)
+        cols = panel.columns(t)
+        cases, pop = panel.cases[:, cols], panel.pop[:, cols]
+
+        # sort the rows by region and add a group holding every row for the global row
+        names, group = np.unique(panel.regions.astype(str), return_inverse=True)
+        order = np.argsort(group, kind="stable")
+        starts = np.searchsorted(group[order], np.arange(names.size))
+        bounds = [*zip(starts, [*starts[1:], len(order)]), (0, len(order))]
+        regions = [*names, GLOBAL]
+
+        def reduce(x):
+            return np.concatenate([_grouped(x, order, starts), _grouped(x, order, [0])])
+
+        values = {DataNames.cases: reduce(cases), "pop": reduce(pop)}
+        # incidence only counts the cases of country-years with a population
+        covered = reduce(np.where(np.isfinite(pop), cases, 0))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            values["incidence"] = pop_norm * panel.ppy * covered / values["pop"]
+
+        for measure, x in ((DataNames.mi, path[..., 1]), (DataNames.cv, path[..., 0])):
+            # population-weighted mean over the countries with a value
+            w = np.where(np.isfinite(x) & np.isfinite(pop), pop, 0)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                values[measure] = reduce(w * x) / reduce(w)
+
+            # quantiles across the countries of each group
+            xs = x[order]
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)
+                values[f"{measure}_q"] = np.stack([
+                    np.moveaxis(np.nanquantile(xs[a:b], quantiles, axis=0), 0, -1) for a, b in bounds
+                ])
+
+        params = dict(ny=ny, pop_norm=pop_norm, s=s, dx=dx, ppy=panel.ppy)
+        return cls(regions, t, quantiles, values, params=params)
+
+    def __repr__(self):
+        return (f"<{self.__class__.__name__}: {len(self.regions)} regions x {self.years.size} years, "
+                f"measures {', '.join(self.values)}>")
+
+    def _select(self, region=None, years=None):
+        """Row and column index for a region (or list of regions) and a (start, end) year range"""
+        if region is None:
+            rows = np.arange(len(self.regions))
+        else:
+            rows = np.array([self.region_index[r] for r in np.atleast_1d(region)], dtype=int)
+        cols = np.arange(self.years.size)
+        if years is not None:
+            start, end = years
+            cols = np.flatnonzero((self.years >= start) & (self.years <= end))
+        return rows, cols
+
+    def get(self, measure, region=None, years=None):
+        """Values of a measure for a region (or list) and an inclusive (start, end) year range.
+
+        Returns:
+            ndarray: Shape (regions, years), or (regions, years, quantiles) for "<measure>_q".
+        """
+        rows, cols = self._select(region, years)
+        return self.values[measure][np.ix_(rows, cols)]
+
+    def query(self, region=None, years=None):
+        """Long-format table of every measure for a region (or list) and a (start, end) year range.
+
+        Returns:
+            DataFrame: One row per (region, year), quantile measures as one column per
+            quantile (e.g. mi_q50).
+        """
+        import pandas as pd
+
+        rows, cols = self._select(region, years)
+        table = {
+            DataNames.region: np.repeat(self.regions[rows], cols.size),
+            DataNames.year: np.tile(self.years[cols], rows.size),
+        }
+        for measure, x in self.values.items():
+            x = x[np.ix_(rows, cols)]
+            if x.ndim == 2:
+                table[measure] = x.ravel()
+            else:
+                for ix, q in enumerate(self.quantiles):
+                    table[f"{measure}{round(100 * q):02d}"] = x[..., ix].ravel()
+        return pd.DataFrame(table)
+
+    def save(self, filename):
+        """Write the cube to a .npz file"""
+        np.savez(
+            filename,
+            regions=self.regions.astype(str),
+            years=self.years,
+            quantiles=self.quantiles,
+            params=json.dumps(self.params),
+            **{f"values_{k}": v for k, v in self.values.items()},
+        )
+
+    @classmethod
+    def load(cls, filename):
+        """Read a cube written by save"""
+        with np.load(filename) as f:
+            values = {k[len("values_"):]: f[k] for k in f.files if k.startswith("values_")}
+            return cls(f["regions"], f["years"], f["quantiles"], values,
+                       params=json.loads(str(f["params"])))
+
+
+def load_cube(panel, cache=True, year=None, quantiles=(0.1, 0.5, 0.9), ny=10, pop_norm=100000, s=3, dx=2):
+    """RegionCube of a panel, kept in the data cache.
+
+    The cache file is keyed on the parameters and on the hashes of the files the panel
+    was read from (Panel.sources, kept by load_panel), so checking the cache does not
+    read the panel's arrays. A panel built in memory has no sources and is keyed on a
+    hash of its arrays and labels instead. Arguments as in RegionCube.from_panel.
+
+    Returns:
+        RegionCube
+    """
+    kwargs = dict(year=year, quantiles=quantiles, ny=ny, pop_norm=pop_norm, s=s, dx=dx)
+    if not cache:
+        return RegionCube.from_panel(panel, **kwargs)
+
+    h = hashlib.sha1()
+    if panel.sources is not None:
+        h.update(json.dumps(panel.sources, sort_keys=True).encode())
+    else:
+        for x in (panel.cases, panel.pop, panel.years):
+            h.update(np.ascontiguousarray(x).data)
+        h.update("|".join(map(str, [*panel.isos, *panel.regions])).encode())
+    h.update(f"{type(panel).__name__}|{panel.ppy}".encode())
+    h.update(json.dumps({k: np.asarray(v).tolist() for k, v in kwargs.items() if v is not None}).encode())
+    filename = Path(paths.data) / CACHE_DIR / f"cube_{h.hexdigest()[:12]}.npz"
+
+    if filename.exists():
+        return RegionCube.load(filename)
+
+    cube = RegionCube.from_panel(panel, **kwargs)
+    # write to a scratch file and swap it in, so concurrent readers never see a partial file
+    filename.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=filename.parent, suffix=".npz")
+    os.close(fd)
+    cube.save(tmp)
+    os.replace(tmp, filename)
+    return cube
@@ -0,0 +1,121 @@
+"""
+Incremental canonical path: append one reporting year at a time without recomputing history.
+
+The weighted mean incidence (and the smoothed CV) at year n uses the growing-length
+kernel calc_weights(n), i.e. Gaussian weights g(d) over the lags d = 0 .. n-1 divided by
+their sum. g(d) depends only on the lag, so appending a year only needs the recent
+values (g is below machine precision beyond a few kernel widths) and a running sum of
+g for the normalization.
+"""
+import numpy as np
+
+from src import utils
+
+
+class _KernelSmoother:
+    """Running growing-length Gaussian average (see calc_weights) for many series.
+
+    Args:
+        nrows (int): Number of series.
+        s (float): Width of the Gaussian kernel.
+        dx (float): Offset of the Gaussian kernel.
+        tol (float): Lags whose weight is below tol (relative to the peak) are dropped.
+    """
+
+    def __init__(self, nrows, s=3, dx=2, tol=1e-16):
+        self.s = s
+        # calc_weights(n) puts weight exp(-0.5*(d - c)**2/s**2) on lag d
+        self.c = 2 * dx - 2
+        size = max(1, int(np.ceil(self.c + s * np.sqrt(-2 * np.log(tol)))) + 1)
+        # kernel by lag, and the most recent values (oldest first)
+        self.g = self.weight(np.arange(size))
+        self.buffer = np.zeros((nrows, size))
+        # non-finite values seen so far, see utils.carry_nonfinite
+        self.up = np.zeros(nrows, dtype=bool)
+        self.down = np.zeros(nrows, dtype=bool)
+        self.nan = np.zeros(nrows, dtype=bool)
+        self.n = 0
+        self.norm = 0.0
+
+    def weight(self, d):
+        return np.exp(-0.5 * (d - self.c) ** 2 / self.s ** 2)
+
+    def append(self, x):
+        """Add the next value of every series, returns the smoothed values at this point"""
+        x = np.asarray(x, dtype=float)
+        self.n += 1
+        self.norm += self.weight(self.n - 1)
+
+        # shift the window and keep non-finite values out of the sum
+        bad = ~np.isfinite(x)
+        self.buffer[:, :-1] = self.buffer[:, 1:]
+        self.buffer[:, -1] = np.where(bad, 0, x)
+        self.up |= x == np.inf
+        self.down |= x == -np.inf
+        self.nan |= np.isnan(x)
+
+        m = min(self.n, self.g.size)
+        y = self.buffer[:, -m:] @ self.g[m-1::-1] / self.norm
+        y[self.up] = np.inf
+        y[self.down] = -np.inf
+        y[self.nan | (self.up & self.down)] = np.nan
+        return y
+
+
+class IncrementalPath:
+    """Canonical path (CV and weighted mean incidence) updated one year at a time.
+
+    Appending a year costs O(kernel window) per location, independent of the length
+    of the history. The results match calc_canonical_path / calc_wmi_batch over the
+    full history up to the dropped kernel tail (lags weighted below tol). Instances
+    pickle, so the running state can be kept between runs.
+
+    Args:
+        n (int): Number of locations.
+        ny (int, optional): Local CV window length. Defaults to 10.
+        pop_norm (int, optional): The normalization factor for the population. Defaults to 100000.
+        s (float, optional): Width of the Gaussian kernels. Defaults to 3.
+        dx (float, optional): Offset of the incidence kernel, the CV kernel uses dx=0. Defaults to 2.
+        tol (float, optional): Relative kernel weight below which old lags are dropped. Defaults to 1e-16.
+    """
+
+    def __init__(self, n, ny=10, pop_norm=100000, s=3, dx=2, tol=1e-16):
+        self.ny = ny
+        self.pop_norm = pop_norm
+        self.wmi = _KernelSmoother(n, s=s, dx=dx, tol=tol)
+        self.cv = _KernelSmoother(n, s=s, dx=0, tol=tol)
+        self.recent = np.zeros((n, ny))
+        self.t = []
+
+    def append(self, cases, pop, year=None):
+        """Add the cases and population of every location for the next year.
+
+        Args:
+            cases (ndarray): Cases of each location, shape (n,), missing reports as zeros.
+            pop (ndarray): Population of each location, shape (n,).
+            year (int, optional): Year of the new column. Defaults to the previous year + 1.
+
+        Returns:
+            tuple: CV and mean incidence of each location for this year. The CV is NaN
+            until ny years have been appended.
+        """
+        year = year if year is not None else (self.t[-1] + 1 if self.t else 0)
+        self.t.append(year)
+
+        mi = self.pop_norm * self.wmi.append(np.asarray(cases, dtype=float) / np.asarray(pop, dtype=float))
+
+        self.recent[:, :-1] = self.recent[:, 1:]
+        self.recent[:, -1] = cases
+        if len(self.t) >= self.ny:
+            lcv, _ = utils.calc_lcv_batch(self.recent, np.arange(self.ny), ny=self.ny)
+            cv = self.cv.append(lcv[:, 0])
+        else:
+            cv = np.full(mi.shape, np.nan)
+
+        return cv, mi
+
+    def extend(self, cases, pop, t):
+        """Append several years, cases and pop of shape (n, years). Returns cv and mi of the same shape"""
+        out = [self.append(cases[:, ix], pop[:, ix], year=y) for ix, y in enumerate(t)]
+        cv, mi = (np.stack(x, axis=-1) for x in zip(*out))
+        return cv, mi
@@ -0,0 +1,397 @@
+"""
+Columnar in-memory store for the cleaned case and population tables.
+
+The cleaned CSVs hold one country time series per row. A Panel aligns the two tables
+once, so that pulling a country's data is a dictionary lookup and a slice instead of a
+boolean scan of the DataFrame for every year. load_panel keeps a memory-mappable copy of
+the aligned panel next to the CSVs so it is only parsed once.
+"""
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from src import paths
+from src.standards import DataNames
+from src.timing import timed
+
+# folder (inside the data folder) holding the binary panel caches
+CACHE_DIR = "cache"
+
+# file in a panel cache folder naming its current version (see _write_cache)
+CURRENT = "CURRENT"
+
+# files of a cache folder from before versions
+LEGACY_FILES = ("cases.npy", "pop.npy", "years.npy", "labels.json", "sources.json")
+
+
+class Panel:
+    """Aligned (location x year) case and population matrices.
+
+    Rows are the locations present in both the incidence and the population tables,
+    columns are years, or ppy periods per year for sub-annual data (e.g. ppy=12 for
+    monthly data, in which case years holds decimal years).
+
+    Attributes:
+        isos (ndarray): ISO3 code of each row.
+        regions (ndarray): Region of each row.
+        countries (ndarray): Country name of each row.
+        years (ndarray): Year of each column (decimal years if ppy > 1).
+        ppy (int): Periods per year.
+        cases (ndarray): float64 cases (rows x years), missing reports filled with zeros.
+        pop (ndarray): float64 population (rows x years), missing values are NaN.
+        iso_index (dict): ISO3 code -> row.
+        year_index (dict): Year -> column (period number, round(year * ppy), if ppy > 1).
+        region_index (dict): Region -> array of rows.
+        sources (dict): sha256 of each data file the panel was read from (name -> hash),
+            None for a panel built in memory.
+    """
+
+    def __init__(self, isos, years, cases, pop, regions=None, countries=None, ppy=1):
+        self.isos = np.asarray(isos, dtype=object)
+        self.ppy = int(ppy)
+        self.years = np.asarray(years, dtype=int if self.ppy == 1 else float)
+        self.cases = np.ascontiguousarray(cases, dtype=np.float64)
+        self.pop = np.ascontiguousarray(pop, dtype=np.float64)
+        n = len(self.isos)
+        self.regions = np.asarray(regions if regions is not None else [""] * n, dtype=object)
+        self.countries = np.asarray(countries if countries is not None else self.isos, dtype=object)
+
+        # check that the matrices line up with the labels
+        assert self.cases.shape == (n, self.years.size)
+        assert self.pop.shape == self.cases.shape
+
+        self.iso_index = {iso: ix for ix, iso in enumerate(self.isos)}
+        self.year_index = {self._period(y): ix for ix, y in enumerate(self.years)}
+        self.region_index = {
+            region: np.flatnonzero(self.regions == region) for region in np.unique(self.regions)
+        }
+        self.sources = None
+
+    @classmethod
+    def from_dataframes(cls, inc_df, pop_df, years=None):
+        """Build a panel from the cleaned incidence and population DataFrames.
+
+        Args:
+            inc_df (DataFrame): Cleaned WHO incidence, one country per row, one column per year.
+            pop_df (DataFrame): Cleaned World Bank population, same layout.
+            years (array, optional): Years to keep. Defaults to all years in both tables.
+
+        Returns:
+            Panel
+        """
+        inc_df = inc_df.drop_duplicates(DataNames.iso).set_index(DataNames.iso)
+        pop_df = pop_df.drop_duplicates(DataNames.iso).set_index(DataNames.iso)
+
+        if years is None:
+            years = [int(c) for c in inc_df.columns if c.isdigit() and c in pop_df.columns]
+        cols = [str(y) for y in years]
+
+        # locations in both datasets
+        isos = [iso for iso in inc_df.index if iso in pop_df.index]
+
+        # fill nans with zeros in cases
+        cases = np.nan_to_num(inc_df.loc[isos, cols].to_numpy(dtype=np.float64))
+        pop = pop_df.loc[isos, cols].to_numpy(dtype=np.float64)
+
+        regions = inc_df.loc[isos, DataNames.region].to_numpy() if DataNames.region in inc_df else None
+        countries = pop_df.loc[isos, DataNames.country].to_numpy() if DataNames.country in pop_df else None
+
+        return cls(isos, years, cases, pop, regions=regions, countries=countries)
+
+    @classmethod
+    def from_monthly_dataframes(cls, inc_df, pop_df, years=None):
+        """Build a monthly panel (ppy=12) from cleaned monthly incidence and annual population.
+
+        Args:
+            inc_df (DataFrame): Cleaned monthly WHO incidence, one country per row, one
+                "YYYY-MM" column per month (see clean_data.clean_incidence_monthly).
+            pop_df (DataFrame): Cleaned World Bank population, one column per year. Each
+                month uses the population of its year.
+            years (array, optional): Years to keep. Defaults to all years in both tables.
+
+        Returns:
+            Panel
+        """
+        inc_df = inc_df.drop_duplicates(DataNames.iso).set_index(DataNames.iso)
+        pop_df = pop_df.drop_duplicates(DataNames.iso).set_index(DataNames.iso)
+
+        months = [c for c in inc_df.columns if c[:4].isdigit() and c[4:5] == "-"]
+        if years is not None:
+            months = [c for c in months if int(c[:4]) in set(int(y) for y in years)]
+        months = [c for c in sorted(months) if c[:4] in pop_df.columns]
+
+        isos = [iso for iso in inc_df.index if iso in pop_df.index]
+
+        # fill nans with zeros in cases
+        cases = np.nan_to_num(inc_df.loc[isos, months].to_numpy(dtype=np.float64))
+        pop = pop_df.loc[isos, [c[:4] for c in months]].to_numpy(dtype=np.float64)
+        t = [int(c[:4]) + (int(c[5:7]) - 1) / 12 for c in months]
+
+        regions = inc_df.loc[isos, DataNames.region].to_numpy() if DataNames.region in inc_df else None
+        countries = pop_df.loc[isos, DataNames.country].to_numpy() if DataNames.country in pop_df else None
+
+        return cls(isos, t, cases, pop, regions=regions, countries=countries, ppy=12)
+
+    @classmethod
+    def from_files(cls, cases: str, population: str, years=None, ppy=1):
+        """Build a panel from the cleaned data files (see utils.get_datafiles), ppy=12 for monthly cases"""
+        from src.utils import get_datafiles
+
+        inc_df, pop_df = get_datafiles(cases=cases, population=population)
+        if ppy == 12:
+            panel = cls.from_monthly_dataframes(inc_df, pop_df, years=years)
+        else:
+            panel = cls.from_dataframes(inc_df, pop_df, years=years)
+        if years is None:
+            panel.sources = {name: _file_hash(paths.cleaned_file(name)) for name in (cases, population)}
+        return panel
+
+    def __len__(self):
+        return len(self.isos)
+
+    def __contains__(self, code):
+        return code in self.iso_index
+
+    def __repr__(self):
+        unit = "years" if self.ppy == 1 else f"periods at {self.ppy}/year"
+        return (f"<{self.__class__.__name__}: {len(self)} locations, "
+                f"{self.years.size} {unit} ({self.years.min():g}-{self.years.max():g})>")
+
+    def _period(self, year):
+        """Key of a (decimal) year in year_index"""
+        return int(round(float(year) * self.ppy))
+
+    def rows(self, code):
+        """Row index (int) of an ISO3 code, or an array of rows for a list of codes"""
+        if isinstance(code, str):
+            return self.iso_index[code]
+        return np.array([self.iso_index[c] for c in code], dtype=int)
+
+    def columns(self, year):
+        """Column slice (contiguous years) or index array for the requested years"""
+        cols = np.array([self.year_index[self._period(y)] for y in np.atleast_1d(year)], dtype=int)
+        if cols.size and np.all(np.diff(cols) == 1):
+            return slice(cols[0], cols[-1] + 1)
+        return cols
+
+    def labels(self):
+        """Label columns of the rows (name -> array), e.g. for long-format tables"""
+        return {
+            DataNames.iso: self.isos,
+            DataNames.country: self.countries,
+            DataNames.region: self.regions,
+        }
+
+    def row(self, code):
+        """Cases and population of one location over all years, as views into the panel"""
+        ix = self.iso_index[code]
+        return self.cases[ix], self.pop[ix]
+
+    def region(self, region):
+        """Cases and population of every location in a region (rows follow region_index)"""
+        ix = self.region_index[region]
+        return self.cases[ix], self.pop[ix]
+
+    def get_cases_pop(self, code, year=None):
+        """Cases, population and years for one location (or a list of locations).
+
+        Same return values as utils.get_cases_pop. For a single location and a
+        contiguous run of years the arrays are read-only views into the panel.
+        """
+        year = self.years if year is None else np.asarray(year)
+        ix = self.rows(code)
+        cols = self.columns(year)
+        cases, pop = self.cases[ix][..., cols], self.pop[ix][..., cols]
+        if isinstance(ix, int) and isinstance(cols, slice):
+            cases, pop = cases.view(), pop.view()
+            cases.flags.writeable = False
+            pop.flags.writeable = False
+        return cases, pop, np.array(year)
+
+    def save(self, path):
+        """Write the panel as a directory of .npy arrays (memory-mappable) plus a labels file"""
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        np.save(path / "cases.npy", self.cases)
+        np.save(path / "pop.npy", self.pop)
+        np.save(path / "years.npy", self.years)
+        labels = {
+            DataNames.iso: list(self.isos),
+            DataNames.region: list(self.regions),
+            DataNames.country: list(self.countries),
+            "ppy": self.ppy,
+        }
+        with open(path / "labels.json", "w") as f:
+            json.dump(labels, f)
+
+    @classmethod
+    def load(cls, path, mmap_mode="r"):
+        """Load a panel written by save, memory-mapping the arrays by default"""
+        path = Path(path)
+        with open(path / "labels.json") as f:
+            labels = json.load(f)
+        panel = cls(
+            labels[DataNames.iso],
+            np.load(path / "years.npy"),
+            np.load(path / "cases.npy", mmap_mode=mmap_mode),
+            np.load(path / "pop.npy", mmap_mode=mmap_mode),
+            regions=labels[DataNames.region],
+            countries=labels[DataNames.country],
+            ppy=labels.get("ppy", 1),
+        )
+        # a cached panel (see load_panel) records the hashes of its sources
+        if (path / "sources.json").exists():
+            with open(path / "sources.json") as f:
+                panel.sources = {name: info["sha256"] for name, info in json.load(f).items()}
+        return panel
+
+
+def _file_hash(filename, blocksize=1 << 20):
+    """sha256 of a file"""
+    h = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(blocksize), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _source_info(filename, previous=None):
+    """mtime, size and hash of a source file; the hash is reused if mtime and size are unchanged"""
+    stat = os.stat(filename)
+    info = {"mtime": stat.st_mtime, "size": stat.st_size}
+    if previous is not None and all(previous.get(k) == v for k, v in info.items()):
+        info["sha256"] = previous["sha256"]
+    else:
+        info["sha256"] = _file_hash(filename)
+    return info
+
+
+def _current(cache_dir):
+    """Folder of the current version of the panel cached in cache_dir, or None"""
+    try:
+        with open(Path(cache_dir) / CURRENT) as f:
+            version = Path(cache_dir) / f.read().strip()
+    except FileNotFoundError:
+        return None
+    return version if version.is_dir() else None
+
+
+def _cache_state(cache_dir, sources):
+    """Whether the panel cached in cache_dir is up to date with sources (name -> file).
+
+    Returns:
+        tuple: fresh (bool) and the current _source_info of each source, to store with
+        the panel when it is rebuilt.
+    """
+    version = _current(cache_dir)
+    meta = {}
+    if version is not None and (version / "sources.json").exists():
+        with open(version / "sources.json") as f:
+            meta = json.load(f)
+
+    info = {name: _source_info(fn, meta.get(name)) for name, fn in sources.items()}
+    fresh = bool(meta) and meta.keys() == info.keys() and all(
+        meta[name]["sha256"] == info[name]["sha256"] for name in info
+    )
+    if fresh and info != meta:
+        # touched but unchanged, refresh the mtimes so the hash is skipped next time
+        try:
+            _replace_file(version / "sources.json", json.dumps(info))
+        except OSError:
+            # the version was removed meanwhile, it is refreshed on the next load
+            pass
+    return fresh, info
+
+
+def _replace_file(filename, text):
+    """Write text to a scratch file and swap it in, so readers never see a partial file"""
+    fd, tmp = tempfile.mkstemp(dir=Path(filename).parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        os.replace(tmp, filename)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _write_cache(cache_dir, panel, info):
+    """Save panel (and its source info) as a new version of the cache in cache_dir.
+
+    Versions are folders that are never modified once written (apart from the mtimes in
+    sources.json). The file CURRENT names the current one and is replaced atomically,
+    so a reader that resolves it once (see load_cache) reads all its files from a single
+    version, and there is no moment without a cache. The version replaced is kept for
+    readers that resolved it just before the swap, older ones are removed.
+
+    Returns:
+        Path: Folder of the new version.
+    """
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    version = Path(tempfile.mkdtemp(dir=cache_dir, prefix="v"))
+    panel.save(version)
+    # written last, so a version without it is still being written
+    _replace_file(version / "sources.json", json.dumps(info))
+
+    old = _current(cache_dir)
+    _replace_file(cache_dir / CURRENT, version.name)
+
+    keep = {version.name, CURRENT} | ({old.name} if old is not None else set())
+    for entry in cache_dir.iterdir():
+        if entry.name in keep or entry.suffix == ".tmp":
+            continue
+        if entry.is_dir():
+            # complete versions only, another process may be writing one
+            if (entry / "sources.json").exists():
+                shutil.rmtree(entry, ignore_errors=True)
+        elif entry.name in LEGACY_FILES:
+            # an unversioned cache written by an earlier release
+            entry.unlink(missing_ok=True)
+    return version
+
+
+def load_cache(cache_dir, mmap_mode="r"):
+    """Panel of the current version of the cache in cache_dir (see _write_cache)"""
+    version = _current(cache_dir)
+    if version is None:
+        raise FileNotFoundError(f"no panel cached in {cache_dir}")
+    return Panel.load(version, mmap_mode=mmap_mode)
+
+
+@timed
+def load_panel(cases: str, population: str, cache=True, mmap_mode="r", ppy=1):
+    """Load the cleaned incidence and population data as a Panel, using a binary cache.
+
+    On first use the aligned panel is written to `data/cache` next to the CSVs; later
+    loads memory-map it instead of parsing text. The cache is rebuilt when the hash of
+    a source file changes (the hash is only recomputed when its mtime or size change).
+
+    Args:
+        cases (str): Incidence file name, as in utils.get_datafiles.
+        population (str): Population file name, as in utils.get_datafiles.
+        cache (bool, optional): Use (and write) the cache. Defaults to True.
+        mmap_mode (str, optional): Passed to np.load for the cached arrays. Defaults to "r".
+        ppy (int, optional): 12 if the incidence file is monthly. Defaults to 1.
+
+    Returns:
+        Panel
+    """
+    if not cache:
+        return Panel.from_files(cases, population, ppy=ppy)
+
+    sources = {name: str(paths.cleaned_file(name)) for name in (cases, population)}
+    key = hashlib.sha1("|".join([*sources, str(ppy)]).encode()).hexdigest()[:12]
+    cache_dir = Path(paths.data) / CACHE_DIR / f"panel_{key}"
+
+    fresh, info = _cache_state(cache_dir, sources)
+    if not fresh:
+        version = _write_cache(cache_dir, Panel.from_files(cases, population, ppy=ppy), info)
+        return Panel.load(version, mmap_mode=mmap_mode)
+
+    return load_cache(cache_dir, mmap_mode=mmap_mode)
@@ -4,6 +4,8 @@ Exposes common paths useful for manipulating datasets and generating figures.
 """
 from pathlib import Path
 
+from src.standards import DataNames
+
 # Absolute path to the top level of the repository
 root = Path(__file__).resolve().parents[2].absolute()
 
@@ -17,4 +19,13 @@ data = src / "data"
 scripts = src / "scripts"
 
 # Absolute path to the `figures` folder (contains generated figures)
-figures = src / "figures"
\ No newline at end of file
+figures = src / "figures"
+
+
+def cleaned_file(filename):
+    """Cleaned version of a raw data file (see scripts/clean_data.py).
+
+    Cleaned tables are always CSV, named after the raw file without its suffix, e.g.
+    measlescasesbycountrybymonth.xlsx -> data/cleaned_measlescasesbycountrybymonth.csv.
+    """
+    return Path(data) / f"{DataNames.cleaned}_{Path(filename).stem}.csv"
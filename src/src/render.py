@@ -0,0 +1,181 @@
+"""
+Fast rendering of many canonical-path trajectories.
+
+Drawing one artist per trajectory (plt.plot / ax.plot in a loop, one subplot per
+country) costs milliseconds per artist, which is fine for the 9 countries of S3 but
+not for hundreds of countries or thousands of districts. Here all trajectories of an
+axes are one LineCollection (and points one PathCollection), small multiples are laid
+out as cells of a single axes per page, pages are rendered in parallel processes, and
+the collections are optionally rasterized so vector formats (pdf, svg) stay small.
+Pages are drawn on their own Figure and Agg canvas, without pyplot, so the caller's
+backend and open figures are left alone.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+def use_agg():
+    """Select the non-interactive Agg backend for the whole process (call before pyplot
+    is used); for worker processes and script entry points, not library code"""
+    import matplotlib
+
+    matplotlib.use("Agg", force=True)
+
+
+def segments(x, y):
+    """Vertices of the trajectories (rows of x and y) as a list of (k, 2) arrays.
+
+    Like plt.plot, a trajectory is broken where it has non-finite values, so each
+    unbroken run of finite points is one segment.
+    """
+    x, y = np.atleast_2d(x), np.atleast_2d(y)
+    xy = np.stack([x, y], axis=-1)
+    ok = np.isfinite(xy).all(axis=-1)
+    runs = []
+    for row, m in zip(xy, ok):
+        breaks = np.flatnonzero(np.diff(m)) + 1
+        runs.extend(run for run, good in zip(np.split(row, breaks), np.split(m, breaks)) if good[0])
+    return runs
+
+
+def add_paths(ax, x, y, rasterized=True, **kwargs):
+    """Draw every row of x, y as a trajectory in a single LineCollection.
+
+    Args:
+        ax (Axes): Axes to draw in.
+        x (ndarray): x values, shape (trajectories, points), e.g. CV.
+        y (ndarray): y values, same shape, e.g. transformed mean incidence.
+        rasterized (bool, optional): Rasterize the collection in vector output. Defaults to True.
+        **kwargs: Passed to LineCollection (colors, linewidths, alpha, ...).
+
+    Returns:
+        LineCollection
+    """
+    from matplotlib.collections import LineCollection
+
+    lines = LineCollection(segments(x, y), rasterized=rasterized, **kwargs)
+    ax.add_collection(lines)
+    ax.autoscale_view()
+    return lines
+
+
+def add_points(ax, x, y, rasterized=True, **kwargs):
+    """Draw all points of x, y as a single PathCollection (kwargs passed to ax.scatter)"""
+    x, y = np.ravel(x), np.ravel(y)
+    return ax.scatter(x, y, rasterized=rasterized, **kwargs)
+
+
+def render_page(filename, x, y, titles=None, shape=(6, 6), xlim=(0, 4), ylim=None,
+                cell_size=(2.0, 1.6), dpi=100, rasterized=True, color="k", linewidth=1.0):
+    """Save one page of small multiples, one trajectory per cell, drawn in a single axes.
+
+    Each cell is a box in the page's axes; trajectories are scaled from (xlim, ylim) to
+    their cell so the page is one LineCollection for the trajectories, one for the
+    cell frames and a text per title. Points outside the limits are left out.
+
+    Args:
+        filename (str): Output file, format from the suffix.
+        x (ndarray): x values, shape (cells, points).
+        y (ndarray): y values, same shape.
+        titles (list, optional): Title of each cell.
+        shape (tuple, optional): Rows and columns of cells. Defaults to (6, 6).
+        xlim (tuple, optional): x range of every cell. Defaults to (0, 4).
+        ylim (tuple, optional): y range of every cell. Defaults to the range of y.
+        cell_size (tuple, optional): Width and height of a cell in inches. Defaults to (2.0, 1.6).
+        dpi (int, optional): Resolution. Defaults to 100.
+        rasterized (bool, optional): Rasterize the trajectories in vector output. Defaults to True.
+        color (str, optional): Line color. Defaults to "k".
+        linewidth (float, optional): Line width. Defaults to 1.0.
+
+    Returns:
+        str: filename
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.collections import LineCollection
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    x, y = np.atleast_2d(x), np.atleast_2d(y)
+    nrows, ncols = shape
+    assert len(x) <= nrows * ncols
+    if ylim is None:
+        ylim = (np.nanmin(y), np.nanmax(y))
+
+    # cell k spans [col, col + 1) x [row, row + 1) with a margin for its title
+    ix = np.arange(len(x))
+    col, row = ix % ncols, nrows - 1 - ix // ncols
+    pad, top = 0.08, 0.22
+    sx = (1 - 2 * pad) / (xlim[1] - xlim[0])
+    sy = (1 - pad - top) / (ylim[1] - ylim[0])
+    # points outside the limits break the trajectory, as clipping to the axes would
+    inside = (x >= xlim[0]) & (x <= xlim[1]) & (y >= ylim[0]) & (y <= ylim[1])
+    cx = np.where(inside, col[:, None] + pad + (x - xlim[0]) * sx, np.nan)
+    cy = np.where(inside, row[:, None] + pad + (y - ylim[0]) * sy, np.nan)
+
+    fig = Figure(figsize=(ncols * cell_size[0], nrows * cell_size[1]), dpi=dpi)
+    FigureCanvasAgg(fig)
+    ax = fig.add_axes([0, 0, 1, 1])
+    ax.set_axis_off()
+    ax.set_xlim(0, ncols)
+    ax.set_ylim(0, nrows)
+
+    ax.add_collection(LineCollection(segments(cx, cy), colors=color, linewidths=linewidth,
+                                     rasterized=rasterized))
+
+    # cell frames
+    x0, x1 = col + pad, col + 1 - pad
+    y0, y1 = row + pad, row + 1 - top
+    frames = np.stack([
+        np.stack([x0, y0], -1), np.stack([x1, y0], -1), np.stack([x1, y1], -1),
+        np.stack([x0, y1], -1), np.stack([x0, y0], -1),
+    ], axis=1)
+    ax.add_collection(LineCollection(frames, colors="0.6", linewidths=0.5))
+
+    for k, title in enumerate(titles if titles is not None else []):
+        if title is None:
+            continue
+        ax.text(col[k] + 0.5, row[k] + 1 - top / 2, str(title), ha="center", va="center", fontsize=8)
+
+    fig.savefig(filename, dpi=dpi)
+    return filename
+
+
+def _render_page(args):
+    filename, x, y, titles, kwargs = args
+    return render_page(filename, x, y, titles, **kwargs)
+
+
+def small_multiples(x, y, filename, titles=None, shape=(6, 6), max_workers=None, **kwargs):
+    """Render trajectories as pages of small multiples, the pages in parallel processes.
+
+    Args:
+        x (ndarray): x values, shape (trajectories, points), e.g. CV.
+        y (ndarray): y values, same shape, e.g. transformed mean incidence.
+        filename (str): Output file pattern with a {page} field, e.g. "S3_{page:03d}.png".
+        titles (list, optional): Title of each trajectory.
+        shape (tuple, optional): Rows and columns of cells per page. Defaults to (6, 6).
+        max_workers (int, optional): Worker processes; 1 renders in this process and None
+            uses os.cpu_count(). Defaults to None.
+        **kwargs: Passed to render_page (xlim, ylim, dpi, rasterized, ...).
+
+    Returns:
+        list: Files written, one per page.
+    """
+    x, y = np.atleast_2d(x), np.atleast_2d(y)
+    titles = list(titles) if titles is not None else [None] * len(x)
+    if kwargs.get("ylim") is None:
+        # the same y range on every page
+        kwargs["ylim"] = (np.nanmin(y), np.nanmax(y))
+
+    per_page = shape[0] * shape[1]
+    pages = [
+        (filename.format(page=page), x[ix:ix + per_page], y[ix:ix + per_page],
+         titles[ix:ix + per_page], dict(kwargs, shape=shape))
+        for page, ix in enumerate(range(0, len(x), per_page))
+    ]
+
+    if max_workers == 1 or len(pages) == 1:
+        return [_render_page(page) for page in pages]
+    with ProcessPoolExecutor(max_workers or os.cpu_count(), initializer=use_agg) as pool:
+        return list(pool.map(_render_page, pages))
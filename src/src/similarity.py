@@ -0,0 +1,265 @@
+"""
+Nearest-neighbour lookup of locations by the shape of their canonical path.
+
+Each location is embedded as a fixed-length vector: its CV and transformed mean
+incidence (utils.mi_transform) at `points` evenly spaced years of the last `years`
+years, scaled so both measures count alike, so "which countries have a path like
+Nigeria's?" is a k-nearest-neighbour or radius query on the vectors. They go in a
+KD-tree, so a query reads a few leaves instead of comparing every trajectory: scipy's
+cKDTree (scipy is a dependency, see pixi.toml), or the NumPy KDTree below (same query
+interface) where scipy is not installed.
+
+TrajectoryIndex.append takes the next year of cases and population, updates the paths
+with an IncrementalPath (no recomputation of the history) and rebuilds the tree on the
+next query.
+
+    index = TrajectoryIndex.from_panel(panel)
+    index.similar("NGA", k=5)
+"""
+import heapq
+
+import numpy as np
+
+from src import utils
+from src.incremental import IncrementalPath
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+
+class KDTree:
+    """KD-tree over the rows of data, splitting the widest dimension at its median.
+
+    A NumPy stand-in for scipy.spatial.cKDTree (see make_tree) supporting its query (k
+    nearest) and query_ball_point (radius) calls with Euclidean distances. Subtrees whose
+    bounding box is farther than the current k-th neighbour (or r) are skipped, so a
+    query reads a few leaves of `leaf_size` points instead of every point.
+
+    Args:
+        data (ndarray): Points, shape (n, d).
+        leaf_size (int, optional): Most points in a leaf. Defaults to 64.
+    """
+
+    def __init__(self, data, leaf_size=64):
+        self.data = np.asarray(data, dtype=float)
+        self.n = len(self.data)
+        self.leaf_size = leaf_size
+        self.index = np.arange(self.n)
+        self.start, self.end, self.children, self.lo, self.hi = [], [], [], [], []
+
+        stack = [self._add(0, self.n)]
+        while stack:
+            node = stack.pop()
+            a, b = self.start[node], self.end[node]
+            spread = self.hi[node] - self.lo[node]
+            if b - a <= leaf_size or not spread.any():
+                continue
+            dim = np.argmax(spread)
+            idx = self.index[a:b]
+            mid = (b - a) // 2
+            self.index[a:b] = idx[np.argpartition(self.data[idx, dim], mid)]
+            self.children[node] = (self._add(a, a + mid), self._add(a + mid, b))
+            stack.extend(self.children[node])
+
+    def _add(self, start, end):
+        """New node over index[start:end] with its bounding box, returns its id"""
+        pts = self.data[self.index[start:end]]
+        self.start.append(start)
+        self.end.append(end)
+        self.children.append(None)
+        self.lo.append(pts.min(axis=0) if end > start else np.zeros(self.data.shape[1]))
+        self.hi.append(pts.max(axis=0) if end > start else np.zeros(self.data.shape[1]))
+        return len(self.start) - 1
+
+    def _box(self, node, x):
+        """Squared distance from x to the bounding box of a node"""
+        return np.sum(np.maximum(np.maximum(self.lo[node] - x, x - self.hi[node]), 0) ** 2)
+
+    def _leaf(self, node, x):
+        """Indices of the points of a leaf and their squared distances to x"""
+        idx = self.index[self.start[node]:self.end[node]]
+        return idx, np.sum((self.data[idx] - x) ** 2, axis=1)
+
+    def _knn(self, x, k):
+        best_d, best_i = np.full(k, np.inf), np.full(k, self.n)
+        heap = [(self._box(0, x), 0)]
+        while heap:
+            d, node = heapq.heappop(heap)
+            # ties with the k-th neighbour are still read, so the lowest index wins
+            if d > best_d[-1]:
+                break
+            if self.children[node] is None:
+                idx, dist = self._leaf(node, x)
+                d_all, i_all = np.concatenate([best_d, dist]), np.concatenate([best_i, idx])
+                keep = np.lexsort((i_all, d_all))[:k]
+                best_d, best_i = d_all[keep], i_all[keep]
+            else:
+                for child in self.children[node]:
+                    heapq.heappush(heap, (self._box(child, x), child))
+        return np.sqrt(best_d), best_i
+
+    def query(self, x, k=1):
+        """Distances and indices of the k nearest points to each row of x.
+
+        Returns:
+            tuple: Arrays of shape (m, k), nearest (then lowest index) first; missing
+            neighbours (k > n) have distance inf and index n, as in cKDTree.
+        """
+        x = np.atleast_2d(np.asarray(x, dtype=float))
+        dist, index = np.full((len(x), k), np.inf), np.full((len(x), k), self.n)
+        for row, point in enumerate(x):
+            dist[row], index[row] = self._knn(point, k)
+        return dist, index
+
+    def query_ball_point(self, x, r):
+        """Indices of the points within distance r of each row of x (a sorted list per row)"""
+        out = []
+        for point in np.atleast_2d(np.asarray(x, dtype=float)):
+            found, stack = [], [0]
+            while stack:
+                node = stack.pop()
+                if self._box(node, point) > r ** 2:
+                    continue
+                if self.children[node] is None:
+                    idx, dist = self._leaf(node, point)
+                    found.extend(idx[dist <= r ** 2].tolist())
+                else:
+                    stack.extend(self.children[node])
+            out.append(sorted(found))
+        return out
+
+
+def make_tree(data, leaf_size=64):
+    """cKDTree of the rows of data, or the NumPy KDTree if scipy is not installed"""
+    if cKDTree is not None:
+        return cKDTree(data, leafsize=leaf_size)
+    return KDTree(data, leaf_size=leaf_size)
+
+
+class TrajectoryIndex:
+    """Nearest-neighbour index over the recent canonical paths of many locations.
+
+    Args:
+        labels (list): Name of each location, e.g. ISO3 codes.
+        cv (ndarray): CV trajectories, shape (locations, years), the last year latest.
+        mi (ndarray): Mean incidence trajectories, same shape (not transformed).
+        t (ndarray): Years of the trajectories.
+        years (int, optional): Length of the window embedded. Defaults to 20.
+        points (int, optional): Evenly spaced years of the window in the embedding, so
+            vectors have 2 * points dimensions. Defaults to 10.
+        scale (tuple, optional): Divisors of CV and mi_transform(MI). Defaults to their
+            standard deviations over the window.
+        leaf_size (int, optional): Most points in a leaf of the tree. Defaults to 64.
+        path (IncrementalPath, optional): Running path state, needed by append.
+    """
+
+    def __init__(self, labels, cv, mi, t, years=20, points=10, scale=None, leaf_size=64, path=None):
+        assert cv.shape == mi.shape and cv.shape[-1] >= years, "need at least `years` years of paths"
+        self.labels = np.asarray(labels, dtype=object)
+        self.label_index = {label: ix for ix, label in enumerate(self.labels)}
+        self.cv = np.array(cv[:, -years:], dtype=float)
+        self.mi = np.array(mi[:, -years:], dtype=float)
+        self.t = list(np.asarray(t)[-years:])
+        self.points = np.unique(np.linspace(0, years - 1, points).round().astype(int))
+        self.scale = scale
+        self.leaf_size = leaf_size
+        self.path = path
+        self._tree = None
+
+    @classmethod
+    def from_panel(cls, panel, year=None, ny=10, pop_norm=100000, s=3, dx=2, **kwargs):
+        """Index of every location of an (annual) panel.
+
+        The paths are computed with an IncrementalPath over the panel years, so the
+        index can take further years with append. Arguments as in
+        canonical.canonical_path, kwargs passed to TrajectoryIndex.
+        """
+        assert panel.ppy == 1, "the incremental path is annual"
+        year = panel.years if year is None else np.asarray(year)
+        cols = panel.columns(year)
+        path = IncrementalPath(len(panel), ny=ny, pop_norm=pop_norm, s=s, dx=dx)
+        cv, mi = path.extend(panel.cases[:, cols], panel.pop[:, cols], year)
+        return cls(panel.isos, cv, mi, year, path=path, **kwargs)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __repr__(self):
+        return (f"<{self.__class__.__name__}: {len(self)} locations, {self.points.size} points of "
+                f"{self.t[0]}-{self.t[-1]}>")
+
+    def append(self, cases, pop, year=None):
+        """Add the next year of cases and population of every location (see IncrementalPath.append)"""
+        assert self.path is not None, "append needs the running path, see from_panel"
+        cv, mi = self.path.append(cases, pop, year=year)
+        self.cv = np.column_stack([self.cv[:, 1:], cv])
+        self.mi = np.column_stack([self.mi[:, 1:], mi])
+        self.t = self.t[1:] + [self.path.t[-1]]
+        self._tree = None
+
+    def scales(self):
+        """Divisors of CV and mi_transform(MI) in the embedding (see scale)"""
+        if self.scale is not None:
+            return self.scale
+        with np.errstate(invalid="ignore"):
+            return (np.nanstd(self.cv[:, self.points]) or 1.0,
+                    np.nanstd(utils.mi_transform(self.mi[:, self.points])) or 1.0)
+
+    def embed(self, cv, mi):
+        """Embedding vectors of trajectories over the index window, shape (..., 2 * points)"""
+        scale = self.scales()
+        cv = np.asarray(cv, dtype=float)[..., self.points] / scale[0]
+        mi = utils.mi_transform(np.asarray(mi, dtype=float)[..., self.points]) / scale[1]
+        return np.concatenate([cv, mi], axis=-1)
+
+    @property
+    def tree(self):
+        """Search tree of the embeddings of the locations with a complete window (built on demand)"""
+        if self._tree is None:
+            self.vectors = self.embed(self.cv, self.mi)
+            # locations with missing values in the window are left out
+            self.valid = np.flatnonzero(np.isfinite(self.vectors).all(axis=1))
+            self._tree = make_tree(self.vectors[self.valid], leaf_size=self.leaf_size)
+        return self._tree
+
+    def query(self, vectors, k=5):
+        """k nearest locations to each embedding vector (see embed).
+
+        Returns:
+            tuple: Distances and location indices, shape (m, k), nearest first; missing
+            neighbours have distance inf and index -1.
+        """
+        tree = self.tree
+        vectors = np.atleast_2d(vectors)
+        k = min(k, len(self.valid))
+        if k == 0:
+            return np.empty((len(vectors), 0)), np.empty((len(vectors), 0), dtype=int)
+        d, i = tree.query(vectors, k=k)
+        d, i = np.reshape(d, (len(vectors), k)), np.reshape(i, (len(vectors), k))
+        return d, np.where(i < len(self.valid), self.valid[np.minimum(i, len(self.valid) - 1)], -1)
+
+    def query_radius(self, vectors, r):
+        """Indices of the locations within distance r of each embedding vector (a list per vector)"""
+        tree = self.tree
+        return [self.valid[np.asarray(ix, dtype=int)].tolist()
+                for ix in tree.query_ball_point(np.atleast_2d(vectors), r)]
+
+    def _vector(self, label):
+        """Index and embedding of a location"""
+        ix = self.label_index[label]
+        vector = self.embed(self.cv[ix], self.mi[ix])
+        assert np.isfinite(vector).all(), f"{label} has missing values in {self.t[0]}-{self.t[-1]}"
+        return ix, vector
+
+    def similar(self, label, k=5):
+        """The k locations whose paths are closest to a location's, as (label, distance) pairs"""
+        ix, vector = self._vector(label)
+        d, i = self.query(vector, k=k + 1)
+        return [(self.labels[j], dist) for j, dist in zip(i[0], d[0]) if j != ix and j >= 0][:k]
+
+    def within(self, label, r):
+        """Labels of the locations whose paths are within distance r of a location's"""
+        ix, vector = self._vector(label)
+        return [self.labels[j] for j in self.query_radius(vector, r)[0] if j != ix]
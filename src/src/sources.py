@@ -0,0 +1,175 @@
+"""
+Data-source adapters and versioned panels for directories of data extracts.
+
+We keep many versions of the cleaned WHO / World Bank tables (yearly snapshots,
+disease variants). A snapshot is a folder named by its date (YYYY-MM-DD) holding a
+cases and a population table in any supported format (csv, xlsx/xls, parquet; see
+READERS and register_reader):
+
+    data/snapshots/2023-07-15/cleaned_measlescasedata.csv
+    data/snapshots/2023-07-15/cleaned_API_SP.POP.TOTL_DS2_en_csv_v2_84031.csv
+    data/snapshots/2024-07-12/cleaned_measlescasedata.parquet
+    ...
+
+load_snapshots reads the files of every out-of-date snapshot in a thread pool, builds
+one Panel per snapshot date and keeps it in the binary panel cache (as load_panel), so
+snapshots that have not changed are memory-mapped from the cache without being parsed.
+"""
+import fnmatch
+import hashlib
+import datetime
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from src import paths
+from src.panel import CACHE_DIR, Panel, _cache_state, _write_cache, load_cache
+
+# folder (inside the data folder) holding the snapshot folders
+SNAPSHOT_DIR = "snapshots"
+
+# file suffix -> function reading a cleaned table into a DataFrame
+READERS = {}
+
+
+def register_reader(*suffixes):
+    """Register a reader (filename -> DataFrame) for files with the given suffixes"""
+    def register(reader):
+        for suffix in suffixes:
+            READERS[suffix.lower()] = reader
+        return reader
+    return register
+
+
+@register_reader(".csv", ".csv.gz")
+def read_csv(filename):
+    import pandas as pd
+
+    return pd.read_csv(filename)
+
+
+@register_reader(".xlsx", ".xls")
+def read_excel(filename):
+    import pandas as pd
+
+    return pd.read_excel(filename)
+
+
+@register_reader(".parquet", ".pq")
+def read_parquet(filename):
+    # needs pyarrow or fastparquet
+    import pandas as pd
+
+    return pd.read_parquet(filename)
+
+
+def _suffix(filename):
+    """Registered suffix of a file name, or None"""
+    name = Path(filename).name.lower()
+    matches = [s for s in READERS if name.endswith(s)]
+    return max(matches, key=len) if matches else None
+
+
+def read_table(filename):
+    """Read a cleaned table with the reader registered for its suffix.
+
+    Column names are returned as strings (xlsx and parquet files may store the year
+    columns as numbers), as the Panel constructors expect.
+    """
+    suffix = _suffix(filename)
+    if suffix is None:
+        raise ValueError(f"no reader registered for {filename}")
+    df = READERS[suffix](filename)
+    df.columns = [str(c) for c in df.columns]
+    return df
+
+
+def find_snapshots(root=None, cases="*case*", population="*pop*"):
+    """Snapshot folders under root and the cases and population files in each.
+
+    Args:
+        root (str, optional): Folder of snapshot folders. Defaults to data/snapshots.
+        cases (str, optional): Case-insensitive glob of the cases table within a
+            snapshot (e.g. a disease variant). Defaults to "*case*".
+        population (str, optional): Glob of the population table. Defaults to "*pop*".
+
+    Returns:
+        dict: Snapshot date (datetime.date) -> {"cases": path, "population": path},
+        sorted by date. The first readable match in name order is used; folders whose
+        name is not a date, or without a match for both tables, are skipped.
+    """
+    root = Path(root or Path(paths.data) / SNAPSHOT_DIR)
+    snapshots = {}
+    for folder in sorted(root.iterdir()):
+        try:
+            date = datetime.date.fromisoformat(folder.name)
+        except ValueError:
+            continue
+        files = {}
+        for name, pattern in (("cases", cases), ("population", population)):
+            matches = sorted(
+                f for f in folder.iterdir()
+                if fnmatch.fnmatch(f.name.lower(), pattern.lower()) and _suffix(f)
+            )
+            if matches:
+                files[name] = matches[0]
+        if len(files) == 2:
+            snapshots[date] = files
+    return snapshots
+
+
+def _cache_dir(files, ppy):
+    """Panel cache folder of a snapshot, keyed on its file paths"""
+    key = hashlib.sha1("|".join([*map(str, files.values()), str(ppy)]).encode()).hexdigest()[:12]
+    return Path(paths.data) / CACHE_DIR / f"panel_{key}"
+
+
+def load_snapshots(root=None, cases="*case*", population="*pop*", dates=None, ppy=1,
+                   max_workers=None, mmap_mode="r"):
+    """One Panel per snapshot, reading the files of changed snapshots concurrently.
+
+    Args:
+        root, cases, population: Where to look, see find_snapshots.
+        dates (list, optional): Only load these snapshot dates. Defaults to all.
+        ppy (int, optional): 12 if the cases tables are monthly. Defaults to 1.
+        max_workers (int, optional): Reader threads. Defaults to ThreadPoolExecutor's default.
+        mmap_mode (str, optional): Passed to Panel.load for the cached arrays. Defaults to "r".
+
+    Returns:
+        dict: Snapshot date (datetime.date) -> Panel, sorted by date.
+    """
+    snapshots = find_snapshots(root, cases=cases, population=population)
+    if dates is not None:
+        dates = {datetime.date.fromisoformat(str(d)) for d in dates}
+        snapshots = {d: f for d, f in snapshots.items() if d in dates}
+
+    # snapshots whose cache is missing or out of date
+    stale = {}
+    for date, files in snapshots.items():
+        fresh, info = _cache_state(_cache_dir(files, ppy), {k: str(v) for k, v in files.items()})
+        if not fresh:
+            stale[date] = info
+
+    # parse every stale file in parallel (each file once, even if shared by snapshots)
+    todo = sorted({str(f) for date in stale for f in snapshots[date].values()})
+    with ThreadPoolExecutor(max_workers) as pool:
+        tables = dict(zip(todo, pool.map(read_table, todo)))
+
+    for date, info in stale.items():
+        files = snapshots[date]
+        inc_df, pop_df = tables[str(files["cases"])], tables[str(files["population"])]
+        if ppy == 12:
+            panel = Panel.from_monthly_dataframes(inc_df, pop_df)
+        else:
+            panel = Panel.from_dataframes(inc_df, pop_df)
+        _write_cache(_cache_dir(files, ppy), panel, info)
+
+    return {date: load_cache(_cache_dir(files, ppy), mmap_mode=mmap_mode) for date, files in snapshots.items()}
+
+
+def load_snapshot(date, root=None, cases="*case*", population="*pop*", ppy=1, mmap_mode="r"):
+    """Panel of a single snapshot date (str YYYY-MM-DD or datetime.date), see load_snapshots"""
+    panels = load_snapshots(root, cases=cases, population=population, dates=[date], ppy=ppy,
+                            mmap_mode=mmap_mode)
+    if not panels:
+        raise KeyError(f"no snapshot {date}")
+    return next(iter(panels.values()))
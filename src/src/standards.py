@@ -2,13 +2,18 @@
 name standards
 """
 
-import sciris as sc
-
-class DataNames(sc.prettyobj):
+class DataNames:
     cases: str = 'cases'
     year: str = 'year'
+    month: str = 'month'
     iso: str = 'iso3'
     country: str = 'country'
     region: str = 'region'
+    admin1: str = 'admin1'
+    admin2: str = 'admin2'
+    # hierarchical location key, coarse to fine
+    levels: tuple = (iso, admin1, admin2)
     cleaned: str = 'cleaned'
+    cv: str = 'cv'
+    mi: str = 'mi'
         
\ No newline at end of file
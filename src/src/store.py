@@ -0,0 +1,275 @@
+"""
+On-disk store of canonical-path results for dashboards and other readers.
+
+A ResultsStore is a folder holding a columnar table with one row per (location, year,
+parameter set) and the columns iso3, region, year, param, cv and mi. Rows are
+written in chunks, one .npy file per column per chunk, sorted by year so every chunk
+covers a narrow range of years. meta.json keeps a zone map (min and max of each
+column) per chunk, the parameter sets and the codes of the text columns.
+
+query pushes its predicates down: chunks whose zone map rules out a match are
+skipped without being opened, and the remaining chunks are memory-mapped, so only
+the pages of the columns that are used are read.
+
+    store = ResultsStore()
+    store.write_path(panel, year=np.arange(1980, 2019))
+    store.query(region="AFR", year=2014, where=[("cv", ">", 1)])
+"""
+import os
+import json
+import shutil
+import tempfile
+import operator
+from pathlib import Path
+
+import numpy as np
+
+from src import paths
+from src.canonical import canonical_path
+from src.standards import DataNames
+
+# folder (inside the data folder) of the default store
+RESULTS_DIR = "results"
+
+# column -> dtype; text columns (CATEGORIES) are stored as int32 codes
+COLUMNS = {
+    DataNames.iso: np.int32,
+    DataNames.region: np.int32,
+    DataNames.year: np.float64,
+    "param": np.int32,
+    DataNames.cv: np.float64,
+    DataNames.mi: np.float64,
+}
+CATEGORIES = (DataNames.iso, DataNames.region)
+
+# rows per chunk
+CHUNK_ROWS = 1 << 16
+
+OPS = {
+    "==": operator.eq, "!=": operator.ne,
+    "<": operator.lt, "<=": operator.le,
+    ">": operator.gt, ">=": operator.ge,
+    "in": lambda x, v: np.isin(x, v),
+}
+
+
+def _may_match(zone, op, value):
+    """Whether a chunk with column range zone = (min, max) can hold a row matching (op, value)"""
+    lo, hi = zone
+    if lo is None:
+        # all NaN
+        return op == "!="
+    if op == "==":
+        return lo <= value <= hi
+    if op == "<":
+        return lo < value
+    if op == "<=":
+        return lo <= value
+    if op == ">":
+        return hi > value
+    if op == ">=":
+        return hi >= value
+    if op == "in":
+        return any(lo <= v <= hi for v in value)
+    return True
+
+
+class ResultsStore:
+    """Chunked columnar store of canonical-path results (see the module docstring).
+
+    Args:
+        path (str, optional): Folder of the store, created on first write. Defaults to
+            data/results.
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path or Path(paths.data) / RESULTS_DIR)
+        self.meta = {"chunks": [], "params": [], "categories": {c: [] for c in CATEGORIES}, "next": 0}
+        if (self.path / "meta.json").exists():
+            with open(self.path / "meta.json") as f:
+                self.meta = json.load(f)
+        self._codes = {c: {v: ix for ix, v in enumerate(self.meta["categories"][c])} for c in CATEGORIES}
+
+    def __len__(self):
+        return sum(chunk["rows"] for chunk in self.meta["chunks"])
+
+    def __repr__(self):
+        return (f"<{self.__class__.__name__}: {len(self)} rows in {len(self.meta['chunks'])} chunks, "
+                f"{len(self.meta['params'])} parameter sets>")
+
+    @property
+    def params(self):
+        """Parameter sets, indexed by the param column"""
+        return self.meta["params"]
+
+    def param_id(self, params):
+        """Index of a parameter set (dict), or None if it is not in the store"""
+        params = {k: _plain(v) for k, v in params.items()}
+        return self.params.index(params) if params in self.params else None
+
+    def _encode(self, column, values, add=False):
+        """Codes of text values (new values get new codes if add, else -1)"""
+        codes = self._codes[column]
+        out = np.empty(len(values), dtype=np.int32)
+        for ix, v in enumerate(values):
+            v = str(v)
+            if v not in codes and add:
+                codes[v] = len(codes)
+                self.meta["categories"][column].append(v)
+            out[ix] = codes.get(v, -1)
+        return out
+
+    def _save_meta(self):
+        # write to a scratch file and swap it in, so readers never see a partial file
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix=".json")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.meta, f)
+        os.replace(tmp, self.path / "meta.json")
+
+    def append(self, columns, params, chunk_rows=CHUNK_ROWS):
+        """Write the rows of one parameter set, replacing any rows stored for it before.
+
+        Args:
+            columns (dict): iso3, region, year, cv and mi arrays of equal length.
+            params (dict): The parameter set (e.g. ny, pop_norm, s, dx, start_year, end_year).
+            chunk_rows (int, optional): Rows per chunk. Defaults to CHUNK_ROWS.
+        """
+        self.path.mkdir(parents=True, exist_ok=True)
+        params = {k: _plain(v) for k, v in params.items()}
+        if params not in self.params:
+            self.params.append(params)
+        pid = self.params.index(params)
+
+        data = {
+            DataNames.iso: self._encode(DataNames.iso, columns[DataNames.iso], add=True),
+            DataNames.region: self._encode(DataNames.region, columns[DataNames.region], add=True),
+            DataNames.year: np.asarray(columns[DataNames.year], dtype=np.float64),
+            DataNames.cv: np.asarray(columns[DataNames.cv], dtype=np.float64),
+            DataNames.mi: np.asarray(columns[DataNames.mi], dtype=np.float64),
+        }
+        data["param"] = np.full(len(data[DataNames.year]), pid, dtype=np.int32)
+
+        # sort by year (then location) so each chunk covers few years
+        order = np.lexsort((data[DataNames.iso], data[DataNames.year]))
+        data = {k: v[order] for k, v in data.items()}
+
+        old = [c for c in self.meta["chunks"] if c["param"] == pid]
+        chunks = [c for c in self.meta["chunks"] if c["param"] != pid]
+        for start in range(0, len(order), chunk_rows):
+            name = f"chunk_{self.meta['next']:06d}"
+            self.meta["next"] += 1
+            chunk_dir = self.path / name
+            chunk_dir.mkdir()
+            zone = {}
+            for column, dtype in COLUMNS.items():
+                x = np.ascontiguousarray(data[column][start:start + chunk_rows], dtype=dtype)
+                np.save(chunk_dir / f"{column}.npy", x)
+                finite = x[np.isfinite(x)] if x.dtype.kind == "f" else x
+                zone[column] = [_plain(finite.min()), _plain(finite.max())] if finite.size else [None, None]
+            chunks.append({"name": name, "rows": len(x), "param": pid, "zone": zone})
+
+        self.meta["chunks"] = chunks
+        self._save_meta()
+        for chunk in old:
+            shutil.rmtree(self.path / chunk["name"], ignore_errors=True)
+
+    def write_path(self, panel, year=None, ny=10, pop_norm=100000, s=3, dx=2, chunk_rows=CHUNK_ROWS):
+        """Compute the canonical path of every location in a panel and store it.
+
+        Arguments as in canonical.canonical_path. The parameter set is (ny, pop_norm, s,
+        dx, start_year, end_year, ppy), start_year and end_year being the first and last
+        years used, so paths over different year ranges are kept apart.
+        """
+        year = panel.years if year is None else np.asarray(year)
+        path, t = canonical_path(panel, year=year, ny=ny, pop_norm=pop_norm, s=s, dx=dx)
+        n, nt = path.shape[:2]
+        columns = {
+            DataNames.iso: np.repeat(panel.isos, nt),
+            DataNames.region: np.repeat(panel.regions, nt),
+            DataNames.year: np.tile(t, n),
+            DataNames.cv: path[..., 0].ravel(),
+            DataNames.mi: path[..., 1].ravel(),
+        }
+        params = dict(ny=ny, pop_norm=pop_norm, s=s, dx=dx, start_year=year[0], end_year=year[-1],
+                      ppy=panel.ppy)
+        self.append(columns, params, chunk_rows=chunk_rows)
+
+    def _predicates(self, where, **equal):
+        """Predicates as (column, op, value) with text values replaced by their codes"""
+        preds = [(c, "in" if isinstance(v, (list, tuple, set, np.ndarray)) else "==", v)
+                 for c, v in equal.items() if v is not None]
+        preds += list(where or [])
+        out = []
+        for column, op, value in preds:
+            assert column in COLUMNS, f"unknown column {column!r}"
+            assert op in OPS, f"unknown operator {op!r}"
+            if column in CATEGORIES:
+                value = self._encode(column, np.atleast_1d(value)) if op == "in" else \
+                    self._encode(column, [value])[0]
+            elif op == "in":
+                value = np.asarray(list(value))
+            out.append((column, op, value))
+        return out
+
+    def chunks(self, where=None, **equal):
+        """Names of the chunks whose zone maps do not rule out the predicates (see query)"""
+        preds = self._predicates(where, **equal)
+        return [
+            chunk["name"] for chunk in self.meta["chunks"]
+            if all(_may_match(chunk["zone"][c], op, v) for c, op, v in preds)
+        ]
+
+    def query(self, columns=None, where=None, region=None, iso=None, year=None, param=None,
+              as_frame=True):
+        """Rows matching all predicates, reading only the chunks that can hold them.
+
+        Args:
+            columns (list, optional): Columns to return. Defaults to all.
+            where (list, optional): Extra predicates (column, op, value) with op one of
+                ==, !=, <, <=, >, >=, in; e.g. [("cv", ">", 1)].
+            region, iso, year, param: Shorthands for equality (or "in" for a list)
+                predicates on those columns; param is an index into params or a dict.
+            as_frame (bool, optional): Return a DataFrame, else a dict of arrays. Defaults to True.
+
+        Returns:
+            DataFrame or dict: The matching rows, text columns decoded.
+        """
+        if isinstance(param, dict):
+            param = self.param_id(param)
+            param = -1 if param is None else param
+        equal = {DataNames.region: region, DataNames.iso: iso, DataNames.year: year, "param": param}
+        preds = self._predicates(where, **equal)
+        columns = list(columns or COLUMNS)
+
+        parts = {c: [] for c in columns}
+        for name in self.chunks(where, **equal):
+            chunk_dir = self.path / name
+            mask = None
+            for column, op, value in preds:
+                x = np.load(chunk_dir / f"{column}.npy", mmap_mode="r")
+                m = OPS[op](x, value)
+                mask = m if mask is None else mask & m
+            rows = np.flatnonzero(mask) if mask is not None else slice(None)
+            if mask is not None and rows.size == 0:
+                continue
+            for column in columns:
+                parts[column].append(np.load(chunk_dir / f"{column}.npy", mmap_mode="r")[rows])
+
+        out = {}
+        for column in columns:
+            x = np.concatenate(parts[column]) if parts[column] else np.empty(0, dtype=COLUMNS[column])
+            if column in CATEGORIES:
+                labels = np.asarray(self.meta["categories"][column], dtype=object)
+                x = labels[x] if labels.size else x.astype(object)
+            out[column] = x
+
+        if not as_frame:
+            return out
+        import pandas as pd
+
+        return pd.DataFrame(out)
+
+
+def _plain(value):
+    """JSON-friendly version of a numpy scalar"""
+    return value.item() if isinstance(value, np.generic) else value
@@ -0,0 +1,168 @@
+"""
+Subnational (admin-1 / admin-2) panels keyed on a hierarchical location.
+
+A LocationPanel is a Panel whose rows are identified by a key of several levels,
+coarse to fine (DataNames.levels: iso3 / admin1 / admin2). All the batch calculations
+(e.g. canonical.canonical_path) run on it unchanged, and rollup aggregates the
+fine-level arrays to a coarser level without going back to the data files.
+"""
+import json
+from pathlib import Path
+
+import numpy as np
+
+from src.panel import Panel
+from src.standards import DataNames
+
+
+class LocationPanel(Panel):
+    """Aligned (location x year) cases and population keyed on a hierarchical location.
+
+    Args:
+        keys (array): Location key of each row, shape (rows, len(levels)), coarse to fine.
+        years (array): Year of each column.
+        cases (ndarray): Cases (rows x years), missing reports filled with zeros.
+        pop (ndarray): Population (rows x years).
+        levels (tuple, optional): Names of the key levels. Defaults to the first
+            keys.shape[1] of DataNames.levels.
+        regions (array, optional): Region of each row.
+        ppy (int, optional): Periods per year. Defaults to 1.
+
+    Attributes (in addition to Panel's):
+        keys (ndarray): Location key of each row.
+        levels (tuple): Names of the key levels.
+        location_index (dict): Key tuple -> row.
+        iso_index (dict): ISO3 code -> array of rows (a country has several rows).
+    """
+
+    def __init__(self, keys, years, cases, pop, levels=None, regions=None, ppy=1):
+        keys = np.asarray(keys, dtype=object).reshape(len(keys), -1)
+        self.keys = keys
+        self.levels = tuple(levels or DataNames.levels[:keys.shape[1]])
+        assert len(self.levels) == keys.shape[1]
+
+        names = [" / ".join(str(k) for k in key if k) for key in keys]
+        super().__init__(keys[:, 0], years, cases, pop, regions=regions, countries=names, ppy=ppy)
+
+        self.location_index = {tuple(key): ix for ix, key in enumerate(keys)}
+        self.iso_index = {iso: np.flatnonzero(self.isos == iso) for iso in np.unique(self.isos)}
+
+    @classmethod
+    def from_dataframes(cls, inc_df, pop_df, levels=None, years=None):
+        """Build a panel from wide-format cases and population tables with location key columns.
+
+        Args:
+            inc_df (DataFrame): Cases, one location per row (key columns named as in
+                DataNames.levels, optionally a region column), one column per year.
+            pop_df (DataFrame): Population, same layout.
+            levels (tuple, optional): Key columns. Defaults to the DataNames.levels in inc_df.
+            years (array, optional): Years to keep. Defaults to all years in both tables.
+
+        Returns:
+            LocationPanel
+        """
+        levels = list(levels or [c for c in DataNames.levels if c in inc_df.columns])
+        inc_df = inc_df.drop_duplicates(levels).set_index(levels)
+        pop_df = pop_df.drop_duplicates(levels).set_index(levels)
+
+        if years is None:
+            years = [int(c) for c in inc_df.columns if c.isdigit() and c in pop_df.columns]
+        cols = [str(y) for y in years]
+
+        # locations in both datasets
+        index = inc_df.index[inc_df.index.isin(pop_df.index)]
+
+        # fill nans with zeros in cases
+        cases = np.nan_to_num(inc_df.loc[index, cols].to_numpy(dtype=np.float64))
+        pop = pop_df.loc[index, cols].to_numpy(dtype=np.float64)
+        regions = inc_df.loc[index, DataNames.region].to_numpy() if DataNames.region in inc_df else None
+
+        keys = np.array([k if isinstance(k, tuple) else (k,) for k in index], dtype=object)
+        return cls(keys, years, cases, pop, levels=levels, regions=regions)
+
+    def labels(self):
+        """Key level columns and region of the rows"""
+        return {
+            **{level: self.keys[:, ix] for ix, level in enumerate(self.levels)},
+            DataNames.region: self.regions,
+        }
+
+    def rows(self, code):
+        """Row of a location key (tuple), the rows of every location of an ISO3 code (str),
+        or an array of rows for a list of either"""
+        if isinstance(code, tuple):
+            return self.location_index[code]
+        if isinstance(code, str):
+            if code not in self.iso_index:
+                raise KeyError(f"no locations with ISO3 code {code!r}")
+            return self.iso_index[code]
+        rows = [np.atleast_1d(self.rows(c if isinstance(c, str) else tuple(c))) for c in code]
+        return np.concatenate([np.empty(0, dtype=int), *rows])
+
+    def row(self, code):
+        """Cases and population of one location (key, or ISO3 code of a one-level panel)
+        over all years, as views into the panel"""
+        ix = self.rows((code,) if isinstance(code, str) else tuple(code))
+        return self.cases[ix], self.pop[ix]
+
+    def rollup(self, level):
+        """Aggregate to a coarser level of the key by summing cases and population.
+
+        Args:
+            level (str or int): Level name (e.g. DataNames.iso) or key depth to keep.
+
+        Returns:
+            LocationPanel: One row per distinct key prefix. Missing population in any
+            sub-unit makes the aggregate population NaN for that year.
+        """
+        depth = self.levels.index(level) + 1 if isinstance(level, str) else int(level)
+        assert 1 <= depth <= len(self.levels)
+
+        # group rows by key prefix, then sum each contiguous group
+        prefixes = ["\x1f".join(map(str, key[:depth])) for key in self.keys]
+        _, first, group = np.unique(prefixes, return_index=True, return_inverse=True)
+        order = np.argsort(group, kind="stable")
+        starts = np.searchsorted(group[order], np.arange(first.size))
+
+        return self.__class__(
+            self.keys[first, :depth],
+            self.years,
+            np.add.reduceat(self.cases[order], starts, axis=0),
+            np.add.reduceat(self.pop[order], starts, axis=0),
+            levels=self.levels[:depth],
+            regions=self.regions[first],
+            ppy=self.ppy,
+        )
+
+    def to_panel(self):
+        """Country-level Panel (the panel is rolled up to ISO3 first if needed)"""
+        panel = self.rollup(1) if len(self.levels) > 1 else self
+        return Panel(panel.isos, panel.years, panel.cases, panel.pop,
+                     regions=panel.regions, ppy=panel.ppy)
+
+    def save(self, path):
+        """Write the panel as .npy arrays plus a labels file (see Panel.save)"""
+        super().save(path)
+        path = Path(path)
+        with open(path / "labels.json") as f:
+            labels = json.load(f)
+        labels["levels"] = list(self.levels)
+        labels["keys"] = self.keys.tolist()
+        with open(path / "labels.json", "w") as f:
+            json.dump(labels, f)
+
+    @classmethod
+    def load(cls, path, mmap_mode="r"):
+        """Load a panel written by save, memory-mapping the arrays by default"""
+        path = Path(path)
+        with open(path / "labels.json") as f:
+            labels = json.load(f)
+        return cls(
+            labels["keys"],
+            np.load(path / "years.npy"),
+            np.load(path / "cases.npy", mmap_mode=mmap_mode),
+            np.load(path / "pop.npy", mmap_mode=mmap_mode),
+            levels=labels["levels"],
+            regions=labels[DataNames.region],
+            ppy=labels.get("ppy", 1),
+        )
@@ -0,0 +1,124 @@
+"""
+Sensitivity sweep of the canonical path over its smoothing hyperparameters.
+
+The canonical path depends on the width (s) and offset (dx) of the Gaussian kernels,
+the local CV window (ny) and the first year used (start_year). run_sweep evaluates a
+grid of these for every location in a Panel in a process pool. The panel is placed in
+shared memory once and attached by each worker, and results are appended to a CSV as
+grid points complete so the full sweep never has to be held in memory.
+"""
+import os
+import itertools
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from src.panel import Panel
+from src.canonical import canonical_path_table
+
+# swept parameters, in grid order
+PARAMS = ("s", "dx", "ny", "start_year")
+
+# panel attached by each worker process (see _init_worker)
+_panel = None
+_shm = []
+
+
+def parameter_grid(s=(3,), dx=(2,), ny=(10,), start_year=(1980,)):
+    """Cartesian product of the parameter values as a list of dicts"""
+    return [dict(zip(PARAMS, p)) for p in itertools.product(s, dx, ny, start_year)]
+
+
+def _share(array):
+    """Copy an array into a new shared memory block"""
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[:] = array
+    return shm
+
+
+def _attach(name, shape, dtype):
+    """Read-only view of an array in an existing shared memory block"""
+    shm = shared_memory.SharedMemory(name=name)
+    # keep the block mapped for the life of the worker
+    _shm.append(shm)
+    array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    array.flags.writeable = False
+    return array
+
+
+def _init_worker(spec):
+    """Build the worker's panel on top of the shared arrays"""
+    global _panel
+    cases = _attach(spec["cases"], spec["shape"], np.float64)
+    pop = _attach(spec["pop"], spec["shape"], np.float64)
+    _panel = Panel(spec["isos"], spec["years"], cases, pop,
+                   regions=spec["regions"], countries=spec["countries"], ppy=spec["ppy"])
+
+
+def run_point(panel, params, pop_norm=100000):
+    """Canonical path table of every location for one set of parameters"""
+    year = panel.years[panel.years >= params["start_year"]]
+    df = canonical_path_table(panel, year=year, ny=params["ny"], pop_norm=pop_norm,
+                              s=params["s"], dx=params["dx"])
+    for ix, key in enumerate(PARAMS):
+        df.insert(ix, key, params[key])
+    return df
+
+
+def _run_point(point, params, pop_norm):
+    df = run_point(_panel, params, pop_norm=pop_norm)
+    df.insert(0, "point", point)
+    return df
+
+
+def run_sweep(panel, grid, filename, max_workers=None, pop_norm=100000):
+    """Evaluate the canonical path for every parameter set in grid, in parallel.
+
+    Args:
+        panel (Panel): Cases and population.
+        grid (list): Parameter sets (dicts with the keys in PARAMS), e.g. from parameter_grid.
+        filename (str): Output CSV, overwritten. Rows are appended as grid points complete,
+            so they are not in grid order; the "point" column is the index into grid.
+        max_workers (int, optional): Number of worker processes. Defaults to os.cpu_count().
+        pop_norm (int, optional): The normalization factor for the population. Defaults to 100000.
+
+    Returns:
+        str: filename
+    """
+    max_workers = max_workers or os.cpu_count()
+    shms = [_share(panel.cases), _share(panel.pop)]
+    spec = {
+        "cases": shms[0].name,
+        "pop": shms[1].name,
+        "shape": panel.cases.shape,
+        "isos": panel.isos,
+        "years": panel.years,
+        "regions": panel.regions,
+        "countries": panel.countries,
+        "ppy": panel.ppy,
+    }
+
+    if os.path.exists(filename):
+        os.remove(filename)
+    try:
+        with ProcessPoolExecutor(max_workers, initializer=_init_worker, initargs=(spec,)) as pool:
+            todo = iter(enumerate(grid))
+            running = set()
+            header = True
+            while True:
+                # keep a bounded number of grid points in flight
+                for point, params in itertools.islice(todo, 2 * max_workers - len(running)):
+                    running.add(pool.submit(_run_point, point, params, pop_norm))
+                if not running:
+                    break
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result().to_csv(filename, mode="a", header=header, index=False)
+                    header = False
+    finally:
+        for shm in shms:
+            shm.close()
+            shm.unlink()
+
+    return filename
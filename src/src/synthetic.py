@@ -0,0 +1,70 @@
+"""
+Synthetic case and population data, for benchmarks and experiments that run offline.
+
+Series loosely follow the measles pattern in the WHO data: a growing population, an
+incidence that declines as vaccination coverage rises, and irregular outbreaks on top.
+"""
+import numpy as np
+
+from src.panel import Panel
+from src.standards import DataNames
+
+# WHO regions used to label synthetic locations
+REGIONS = ("AFR", "AMR", "EMR", "EUR", "SEAR", "WPR")
+
+
+def synthetic_series(n, nt, ppy=1, start_year=1974, seed=0):
+    """Random cases and population for n locations over nt periods.
+
+    Args:
+        n (int): Number of locations.
+        nt (int): Number of periods.
+        ppy (int, optional): Periods per year (12 for monthly). Defaults to 1.
+        start_year (int, optional): First year. Defaults to 1974.
+        seed (int, optional): Random seed. Defaults to 0.
+
+    Returns:
+        tuple: cases (n, nt), pop (n, nt) and time (nt,), in decimal years if ppy > 1.
+    """
+    rng = np.random.default_rng(seed)
+    t = start_year + np.arange(nt) / ppy
+    years = t - start_year
+
+    # population: 1e4 to 1e8, growing 0-3% a year
+    pop0 = 10 ** rng.uniform(4, 8, size=(n, 1))
+    growth = rng.uniform(0, 0.03, size=(n, 1))
+    pop = np.round(pop0 * (1 + growth) ** years)
+
+    # annual incidence per person declining from ~1e-3 at a location-specific rate,
+    # with lognormal noise and occasional large outbreaks
+    decline = rng.uniform(0, 0.15, size=(n, 1))
+    rate = 1e-3 * rng.uniform(0.2, 2, size=(n, 1)) * np.exp(-decline * years)
+    rate = rate * rng.lognormal(0, 1, size=(n, nt))
+    rate = rate * np.where(rng.random((n, nt)) < 0.1 / ppy, rng.uniform(5, 50, size=(n, nt)), 1)
+
+    cases = rng.poisson(pop * rate / ppy).astype(float)
+
+    return cases, pop, t
+
+
+def synthetic_panel(n, nt, ppy=1, start_year=1974, seed=0):
+    """Panel of synthetic locations (codes S000001, ... and WHO regions in turn)"""
+    cases, pop, t = synthetic_series(n, nt, ppy=ppy, start_year=start_year, seed=seed)
+    isos = [f"S{ix:06d}" for ix in range(n)]
+    regions = [REGIONS[ix % len(REGIONS)] for ix in range(n)]
+    return Panel(isos, t, cases, pop, regions=regions, ppy=ppy)
+
+
+def synthetic_dataframes(n, nt, start_year=1974, seed=0):
+    """Synthetic annual data laid out like the cleaned incidence and population tables"""
+    import pandas as pd
+
+    panel = synthetic_panel(n, nt, start_year=start_year, seed=seed)
+    cols = [str(y) for y in panel.years]
+    inc_df = pd.DataFrame(panel.cases, columns=cols)
+    inc_df.insert(0, DataNames.iso, panel.isos)
+    inc_df.insert(1, DataNames.region, panel.regions)
+    pop_df = pd.DataFrame(panel.pop, columns=cols)
+    pop_df.insert(0, DataNames.country, panel.isos)
+    pop_df.insert(1, DataNames.iso, panel.isos)
+    return inc_df, pop_df
@@ -0,0 +1,111 @@
+"""
+Opt-in timing and peak-memory instrumentation for the figure pipelines.
+
+Set the environment variable CPT_PROFILE to enable it:
+
+    CPT_PROFILE=1 python scripts/Fig1.py                  # report in figures/timing_<script>.json
+    CPT_PROFILE=out.json python scripts/Fig1.py           # report in out.json
+
+Stages are recorded with the `timer` context manager or the `timed` decorator. At exit
+a JSON report with the call count, total/min/max wall time and peak traced memory
+(tracemalloc) of each stage is written. When CPT_PROFILE is unset `timed` returns the
+function unchanged and `timer` does nothing, so instrumented code runs at full speed.
+"""
+import os
+import sys
+import json
+import time
+import atexit
+import tracemalloc
+import functools
+from contextlib import contextmanager
+from pathlib import Path
+
+from src import paths
+
+# environment variable that switches instrumentation on
+ENV_VAR = "CPT_PROFILE"
+
+enabled = os.environ.get(ENV_VAR, "").strip().lower() not in ("", "0", "false", "no")
+
+# stage name -> {"calls", "total", "min", "max", "peak_mb"}
+registry = {}
+
+_depth = 0
+
+
+def _record(name, elapsed, peak):
+    stats = registry.setdefault(name, {"calls": 0, "total": 0.0, "min": float("inf"), "max": 0.0, "peak_mb": 0.0})
+    stats["calls"] += 1
+    stats["total"] += elapsed
+    stats["min"] = min(stats["min"], elapsed)
+    stats["max"] = max(stats["max"], elapsed)
+    stats["peak_mb"] = max(stats["peak_mb"], peak / 2**20)
+
+
+@contextmanager
+def timer(name):
+    """Record the wall time and peak memory of a block under name (no-op when disabled)"""
+    global _depth
+    if not enabled:
+        yield
+        return
+
+    # peak memory is measured from the start of the outermost timed block
+    if _depth == 0:
+        tracemalloc.reset_peak()
+    _depth += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        _depth -= 1
+        _record(name, elapsed, tracemalloc.get_traced_memory()[1])
+
+
+def timed(fn=None, name=None):
+    """Decorator recording each call of fn (under name, default module.function) with timer"""
+    if fn is None:
+        return functools.partial(timed, name=name)
+    if not enabled:
+        return fn
+
+    name = name or f"{fn.__module__}.{fn.__qualname__}"
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with timer(name):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+def report():
+    """Timing report: the stages plus script, wall time since start and the largest stage peak memory"""
+    return {
+        "script": Path(sys.argv[0]).name if sys.argv and sys.argv[0] else "",
+        "wall": time.perf_counter() - _start,
+        "peak_mb": max([stats["peak_mb"] for stats in registry.values()], default=0.0),
+        "stages": registry,
+    }
+
+
+def write_report(filename=None):
+    """Write the report as JSON (see the module docstring for the default location)"""
+    if filename is None:
+        value = os.environ.get(ENV_VAR, "")
+        if value.endswith(".json"):
+            filename = value
+        else:
+            script = Path(sys.argv[0]).stem if sys.argv and sys.argv[0] else "python"
+            filename = Path(paths.figures) / f"timing_{script}.json"
+    Path(filename).parent.mkdir(parents=True, exist_ok=True)
+    with open(filename, "w") as f:
+        json.dump(report(), f, indent=2)
+    return filename
+
+
+_start = time.perf_counter()
+if enabled:
+    tracemalloc.start()
+    atexit.register(write_report)
@@ -1,30 +1,38 @@
 import os
-import pycountry
+import warnings
+from functools import lru_cache
 import numpy as np
-import pandas as pd
 
 # import paths
 from src import paths
 from src.standards import DataNames
+from src.panel import Panel
+from src.countries import default_resolver
+from src.timing import timed
 
+@timed
 def get_datafiles(cases: str, population: str):
     """Returns Measles Incidence from WHO data file and country populations from pop_df
 
     Returns:
         inc_df, pop_df
     """
+    import pandas as pd
+
     # incidence
     # inc_df = pd.read_excel(os.path.join(paths.data, 'measlescasesbycountrybymonth.xlsx'), sheet_name='WEB')
-    inc_df = pd.read_csv(os.path.join(paths.data, f"{DataNames.cleaned}_{cases}"))
+    inc_df = pd.read_csv(paths.cleaned_file(cases))
 
     # population
     # read in population
-    pop_df = pd.read_csv(os.path.join(paths.data, f"{DataNames.cleaned}_{population}"))
+    pop_df = pd.read_csv(paths.cleaned_file(population))
 
     return inc_df, pop_df
 
 def get_data_lookup(inc_df,pop_df):
     """Return DF for matching country names and country codes between datasets"""
+    import pandas as pd
+
     # lookup table
     df = pd.merge(pop_df, inc_df, on='ISO3')
     all_cols = df.columns
@@ -37,13 +45,280 @@ def get_data_lookup(inc_df,pop_df):
     df.drop(drop_cols, axis=1, inplace=True)
     return df
 
-def calc_weights(n, s=3, dx=2):
-    """ Gaussian function for weighting """
+# number of distinct kernels / kernel matrices kept in memory
+KERNEL_CACHE_SIZE = 512
+MATRIX_CACHE_SIZE = 32
+
+# elements per block of rows in the windowed loops (fits in L2 cache)
+CACHE_BLOCK = 1 << 15
+
+# engines for the batch calculations, see set_backend
+BACKENDS = ("numpy", "numba")
+
+_backend = "numpy"
+_jit = None
+
+def set_backend(name="numpy"):
+    """Select the engine used by the batch calculations (and so by the scalar ones).
+
+    "numpy" (the default) is the vectorized path. "numba" runs compiled kernels over the
+    rows in parallel (src._jit); if numba is not installed it falls back to "numpy" with
+    a warning. "auto" picks numba when it is installed. The CPT_BACKEND environment
+    variable sets the backend at import.
+
+    Returns:
+        str: The backend in use.
+    """
+    global _backend, _jit
+    assert name in BACKENDS + ("auto",), f"unknown backend {name!r}"
+    if name != "numpy":
+        try:
+            from src import _jit as jit
+        except ImportError:
+            if name == "numba":
+                warnings.warn("numba is not installed, using the numpy backend")
+            name = "numpy"
+        else:
+            _jit, name = jit, "numba"
+    _backend = name
+    return name
+
+def get_backend():
+    """Name of the backend in use (see set_backend)"""
+    return _backend
+
+set_backend(os.environ.get("CPT_BACKEND", "numpy"))
+
+# floating point types of the batch calculations, see set_dtype
+DTYPES = ("float64", "float32")
+
+# columns per partial product in the compensated float32 matrix products (see _dot)
+SUM_BLOCK = 128
+
+_dtype = np.dtype(np.float64)
+_memory_budget = None
+
+def set_dtype(name="float64"):
+    """Select the floating point type the batch calculations compute and return in.
+
+    "float64" (the default) is the reference. "float32" halves memory and bandwidth; to
+    keep the long sums accurate the window sums of the local CV are pairwise and the
+    kernel products are taken in blocks of SUM_BLOCK columns whose partial results are
+    added with Kahan (compensated) summation, so the error stays at a few float32 ulps
+    instead of growing with the series length. The numba kernels accumulate in
+    float64 whatever the dtype and only store the results as float32. The CPT_DTYPE
+    environment variable sets the dtype at import.
+
+    Returns:
+        str: The dtype in use.
+    """
+    global _dtype
+    assert name in DTYPES, f"unknown dtype {name!r}"
+    _dtype = np.dtype(name)
+    return name
+
+def get_dtype():
+    """Name of the dtype in use (see set_dtype)"""
+    return _dtype.name
+
+def set_memory_budget(nbytes=None):
+    """Limit the scratch memory of the batch calculations.
+
+    With a budget the rows (countries, replicates, ...) are processed in tiles small
+    enough that the temporaries of a tile fit in it; the inputs and results themselves
+    are not counted. None (the default) processes all rows at once. The
+    CPT_MEMORY_BUDGET environment variable sets the budget at import.
+
+    Args:
+        nbytes (int or str, optional): Budget in bytes, or a string with a K, M or G
+            suffix such as "512M".
+
+    Returns:
+        int: The budget in bytes, or None.
+    """
+    global _memory_budget
+    if isinstance(nbytes, str):
+        units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+        nbytes = nbytes.strip().upper().rstrip("B")
+        scale = units.get(nbytes[-1:], 1)
+        nbytes = int(float(nbytes.rstrip("KMG")) * scale)
+    assert nbytes is None or nbytes > 0, "the memory budget must be positive"
+    _memory_budget = nbytes
+    return nbytes
+
+def get_memory_budget():
+    """Memory budget in bytes (see set_memory_budget), or None"""
+    return _memory_budget
+
+set_dtype(os.environ.get("CPT_DTYPE", "float64"))
+set_memory_budget(os.environ.get("CPT_MEMORY_BUDGET") or None)
+
+def row_tiles(n, row_bytes):
+    """Slices splitting n rows into tiles of at most the memory budget (see set_memory_budget).
+
+    Args:
+        n (int): Number of rows.
+        row_bytes (int): Scratch memory needed per row.
 
+    Returns:
+        list: Slices of the rows, a single one without a budget.
+    """
+    step = n if _memory_budget is None else max(1, int(_memory_budget // max(row_bytes, 1)))
+    return [slice(r, r + step) for r in range(0, n, max(step, 1))] or [slice(0, 0)]
+
+def _kahan_add(total, comp, x):
+    """total += x in place, carrying the rounding error in comp (Kahan summation)"""
+    y = x - comp
+    t = total + y
+    np.subtract(t, total, out=comp)
+    comp -= y
+    total[...] = t
+
+def _dot(x, W):
+    """x @ W.T for lower-triangular W in the dtype of x; float32 sums are blocked and compensated.
+
+    Block k of columns only reaches outputs k onward, so the blocked product also skips
+    the zero upper triangle of W.
+    """
+    if x.dtype == np.float64:
+        return x @ W.T
+    # weights below eps**2 of a kernel's peak add nothing but are slow denormals in float32
+    eps = np.finfo(x.dtype).eps
+    W = np.where(W < eps**2 * W.max(axis=1, keepdims=True), 0, W).astype(x.dtype)
+    total = x[..., :SUM_BLOCK] @ W[:, :SUM_BLOCK].T
+    comp = np.zeros_like(total)
+    for k in range(SUM_BLOCK, W.shape[1], SUM_BLOCK):
+        _kahan_add(total[..., k:], comp[..., k:], x[..., k:k+SUM_BLOCK] @ W[k:, k:k+SUM_BLOCK].T)
+    return total
+
+@lru_cache(maxsize=KERNEL_CACHE_SIZE)
+def _gaussian_kernel(n, s, dx):
+    """Normalized Gaussian weights, memoized on (n, s, dx) and returned read-only"""
     x = np.arange(-n, 0) + dx - 1
     w = 1/(s*np.sqrt(2*np.pi)) * np.exp(-0.5*(x+dx)**2/s**2)
-    return w / np.sum(w)
+    w = w / np.sum(w)
+    w.flags.writeable = False
+    return w
+
+@lru_cache(maxsize=MATRIX_CACHE_SIZE)
+def _kernel_matrix(n, s, dx):
+    """Lower-triangular stack of Gaussian kernels, memoized and returned read-only"""
+    W = np.zeros((n, n))
+    for ix in range(1, n+1):
+        W[ix-1, :ix] = _gaussian_kernel(ix, s, dx)
+    W.flags.writeable = False
+    return W
+
+def calc_weights(n, s=3, dx=2):
+    """ Gaussian function for weighting
+
+    Kernels are cached (LRU, keyed on n, s, dx) so the returned array is read-only;
+    copy it before modifying.
+    """
+    return _gaussian_kernel(n, s, dx)
+
+def calc_weight_matrix(n, s=3, dx=2):
+    """Lower-triangular (n x n) matrix whose k-th row holds calc_weights(k+1, s, dx).
+
+    Multiplying a series by the transpose of this matrix evaluates the growing-length
+    Gaussian weighting used by calc_wmi and calc_cv for every output year at once.
+    The matrix is cached like calc_weights and is read-only.
+    """
+    return _kernel_matrix(n, s, dx)
+
+def period_kernel(s=3, dx=2, ppy=1):
+    """Kernel parameters (s, dx) for data with ppy periods per year.
+
+    calc_weights measures lags in samples. For sub-annual data (e.g. ppy=12 for monthly)
+    the kernel is stretched so it has the same shape in years: width s*ppy and an offset
+    that keeps the peak (2*dx - 2 years back) at the same point in time.
+    """
+    return s * ppy, (dx - 1) * ppy + 1
+
+def clear_kernel_cache():
+    """Drop all cached kernels and kernel matrices"""
+    _gaussian_kernel.cache_clear()
+    _kernel_matrix.cache_clear()
+
+def carry_nonfinite(out, x):
+    """Set out (in place) to what a positive-weight sum over x[..., :k+1] gives at each k
+    once non-finite values enter it: +-inf after infinities of one sign, NaN after a NaN
+    or infinities of both signs. Entries before the first non-finite value are kept.
+    """
+    up = np.logical_or.accumulate(x == np.inf, axis=-1)
+    down = np.logical_or.accumulate(x == -np.inf, axis=-1)
+    nan = np.logical_or.accumulate(np.isnan(x), axis=-1) | (up & down)
+    out[up] = np.inf
+    out[down] = -np.inf
+    out[nan] = np.nan
+    return out
+
+@timed
+def calc_wmi_batch(cases, pop, t, pop_norm=100000, start_year=1980, s=3, dx=2, ppy=1):
+    """Calculate weighted mean incidence for many series at once.
+
+    Vectorized equivalent of calc_wmi: the growing-length kernels are stacked into a
+    lower-triangular weight matrix so every year (and every country) is evaluated with
+    a single matrix product.
+
+    Args:
+        cases (ndarray): Case data, shape (..., nt), e.g. (countries, years).
+        pop (ndarray): Population data, same shape as cases.
+        t (ndarray): Time data, shape (nt,).
+        pop_norm (int, optional): The normalization factor for the population. Defaults to 100000.
+        start_year (int, optional): The starting year for the calculation. Defaults to 1980.
+        s (float, optional): Width of the Gaussian kernel (see calc_weights). Defaults to 3.
+        dx (float, optional): Offset of the Gaussian kernel (see calc_weights). Defaults to 2.
+        ppy (int, optional): Periods per year, e.g. 12 for monthly data. Kernel parameters
+            are in years (see period_kernel) and the incidence is annualized. Defaults to 1.
+
+    Returns:
+        tuple: The weighted mean incidence (mi), shape (..., nt - ii), and the time data (t)
+        from start_year onward. As in the weighted sums of the original calc_wmi loop, a
+        non-finite incidence carries into every later year: an infinite one (zero
+        population) gives +-inf, and NaN (missing data, or infinities of both signs) gives
+        NaN. mi has the dtype
+        set by set_dtype and the rows are computed in tiles under the memory budget.
+    """
+    cases = np.asarray(cases)
+    pop = np.asarray(pop)
+    t = np.asarray(t)
+
+    # check that number of cases and population are the same size
+    assert cases.shape == pop.shape
+    # check that number of cases and years are the same size
+    assert cases.shape[-1] == t.size
+    # make sure the we have enough samples
+    assert start_year in t
 
+    ii = np.where(t == start_year)[0][0]
+    s, dx = period_kernel(s, dx, ppy)
+    W = calc_weight_matrix(t.size - ii, s=s, dx=dx)
+
+    nt = t.size - ii
+    # rows as views, the years from start_year are taken per tile
+    x, p = cases.reshape(-1, t.size), pop.reshape(-1, t.size)
+    norm = W.sum(axis=1)
+    mi = np.empty((len(x), nt), dtype=_dtype)
+
+    # inputs, incidence, mask and product of a row
+    for rows in row_tiles(len(x), 6 * nt * _dtype.itemsize):
+        if _backend == "numba":
+            mi[rows] = _jit.wmi(x[rows, ii:].astype(float), p[rows, ii:].astype(float), W, norm,
+                                float(pop_norm * ppy))
+            continue
+
+        # incidence, keeping missing values out of the matrix product
+        inc = x[rows, ii:].astype(_dtype, copy=False) / p[rows, ii:].astype(_dtype, copy=False)
+        bad = ~np.isfinite(inc)
+        tile = pop_norm * ppy * _dot(np.where(bad, 0, inc), W) / norm.astype(_dtype)
+        if bad.any():
+            carry_nonfinite(tile, inc)
+        mi[rows] = tile
+
+    return mi.reshape(cases.shape[:-1] + (nt,)), t[ii:]
+
+@timed
 def calc_wmi(cases, pop, t, pop_norm=100000, start_year=1980):
     """Calculate weighted mean incidence.
 
@@ -66,23 +341,7 @@ def calc_wmi(cases, pop, t, pop_norm=100000, start_year=1980):
     # check that number of cases and years are the same size
     assert cases.size == t.size
 
-    # number of samples
-    nx = len(cases)
-    # make sure the we have enough samples
-    assert start_year in t
-
-    # initialize array
-    mi = np.zeros(t.max() - start_year + 1)
-    ii = np.where(t == start_year)[0][0]
-
-    # loop through calculation
-    for ix in range(1,len(mi)+1):
-        weights = calc_weights(ix)
-        mi[ix-1] = pop_norm * np.sum(weights * cases[ii:(ii+ix)] / pop[ii:(ii+ix)]) / np.sum(weights)
-
-    t = t[ii:]
-
-    return mi, t
+    return calc_wmi_batch(cases, pop, t, pop_norm=pop_norm, start_year=start_year)
 
 def calc_wcv(x, w):
     """Calculate the weighted coefficient of variation.
@@ -114,50 +373,197 @@ def calc_wcv(x, w):
 
     return cv
 
+@timed
+def calc_lcv_batch(cases, time, ny=10):
+    """Local CV for many series at once.
+
+    Vectorized equivalent of calc_lcv. The window sums are accumulated one window
+    offset at a time over cache-sized blocks of rows, so memory stays at the size of
+    the output for any ny, and the mean and variance use the same two-pass arithmetic
+    as calc_wcv, so the `wm > 0` guard sees the values it would in the loop.
+
+    Args:
+        cases (ndarray): Case data, shape (..., nx), e.g. (countries, years).
+        time (ndarray): Time data, shape (nx,).
+        ny (int, optional): Window length. Defaults to 10.
+
+    Returns:
+        tuple: The local CV, shape (..., nx - ny + 1), and the time data aligned to the
+        last point of each window (time[ny-1:]), in the dtype set by set_dtype.
+    """
+    cases = np.asarray(cases)
+    nw = cases.shape[-1] - ny + 1
+    x = cases.reshape(-1, cases.shape[-1])
+    if _backend == "numba":
+        wcv = np.empty((x.shape[0], nw), dtype=_dtype)
+        for rows in row_tiles(len(x), 2 * x.shape[1] * 8):
+            wcv[rows] = _jit.lcv(x[rows].astype(float), ny)
+        return wcv.reshape(cases.shape[:-1] + (nw,)), time[ny-1:]
+
+    if _dtype != np.float64:
+        wcv = _lcv_pairwise(x, ny)
+        return wcv.reshape(cases.shape[:-1] + (nw,)), time[ny-1:]
+
+    wcv = np.empty((x.shape[0], nw))
+
+    # work through blocks of rows small enough to stay in cache across the ny passes
+    step = max(1, CACHE_BLOCK // max(nw, 1))
+    for r in range(0, x.shape[0], step):
+        xb = x[r:r+step].astype(float, copy=False)
+        m = np.zeros((xb.shape[0], nw))
+        v, dev = np.zeros_like(m), np.empty_like(m)
+
+        # weighted mean and std with unit weights, window k covers x[:, k:k+ny]
+        for ix in range(ny):
+            m += xb[:, ix:ix+nw]
+        m /= ny
+        for ix in range(ny):
+            np.subtract(xb[:, ix:ix+nw], m, out=dev)
+            np.square(dev, out=dev)
+            v += dev
+
+        # coefficient of variation is std / mean, zero where the mean is not positive
+        with np.errstate(divide="ignore", invalid="ignore"):
+            wcv[r:r+step] = np.where(m > 0, np.sqrt(v / ny) / m, 0.0)
+
+    wcv = wcv.reshape(cases.shape[:-1] + (nw,))
+    t = time[ny-1:]
+    return wcv, t
+
+def _lcv_pairwise(x, ny):
+    """Local CV of the rows of x in the compute dtype, window sums by pairwise summation.
+
+    Each window is a view of ny consecutive points (sliding_window_view), so the sums
+    are NumPy reductions along the window, which add pairwise and keep float32 error
+    growing only with log(ny).
+    """
+    from numpy.lib.stride_tricks import sliding_window_view
+
+    nw = x.shape[1] - ny + 1
+    wcv = np.empty((x.shape[0], nw), dtype=_dtype)
+    # rows whose (windows x ny) deviations fit in a few cache blocks
+    step = max(1, 8 * CACHE_BLOCK // max(nw * ny, 1))
+    for r in range(0, x.shape[0], step):
+        win = sliding_window_view(x[r:r+step].astype(_dtype, copy=False), ny, axis=1)
+        m = win.sum(axis=-1) / ny
+        dev = win - m[..., None]
+        np.square(dev, out=dev)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            wcv[r:r+step] = np.where(m > 0, np.sqrt(dev.sum(axis=-1) / ny) / m, 0.0)
+    return wcv
+
+@timed
 def calc_lcv(cases, time, ny=10):
     """Local CV is equal weighted CV"""
 
-    # length of data
-    nx = len(cases)
-
-    # weights are 1
-    w = np.ones(ny)
+    # use ny-1 previous points and current one
+    return calc_lcv_batch(cases, time, ny=ny)
 
-    # initialize, use ny-1 previous points and current one
-    wcv = np.zeros(nx-ny+1)
+@timed
+def calc_cv_batch(cases, t, ny=10, s=3, ppy=1):
+    """Gaussian-smoothed local CV for many series at once.
 
-    for ix in range(len(wcv)):
-        data = cases[ix:(ix+ny)]
-        wcv[ix] = calc_wcv(data, w)
+    Vectorized equivalent of calc_cv: the local CV of every row is smoothed with the
+    growing-length kernels (dx=0) in a single product with the cached weight matrix.
 
-    t = time[ny-1:]
-    return wcv, t
+    Args:
+        cases (ndarray): Case data, shape (..., nx), e.g. (countries, years).
+        t (ndarray): Time data, shape (nx,).
+        ny (int, optional): Local CV window length in years. Defaults to 10.
+        s (float, optional): Width of the Gaussian smoothing kernel in years. Defaults to 3.
+        ppy (int, optional): Periods per year, e.g. 12 for monthly data. Defaults to 1.
 
+    Returns:
+        tuple: The smoothed CV, shape (..., nx - ny*ppy + 1), and its time data (t[ny*ppy-1:]).
+    """
+    # calculate local coefficient of variation
+    lcv, lcvt = calc_lcv_batch(cases, t, ny=ny*ppy)
+
+    return smooth_lcv(lcv, s=s, ppy=ppy), lcvt
+
+def smooth_lcv(lcv, s=3, ppy=1):
+    """Gaussian smoothing (growing-length kernels, dx=0) of local CV rows, as in calc_cv_batch"""
+    s, dx = period_kernel(s, 0, ppy)
+    W = calc_weight_matrix(lcv.shape[-1], s=s, dx=dx)
+    norm = W.sum(axis=1)
+    x = lcv.reshape(-1, lcv.shape[-1])
+    out = np.empty(x.shape, dtype=_dtype)
+    # product, compensation and partial product of a row
+    for rows in row_tiles(len(x), 4 * x.shape[1] * _dtype.itemsize):
+        if _backend == "numba":
+            out[rows] = _jit.smooth(x[rows].astype(float), W, norm)
+        else:
+            # keep non-finite values (e.g. the local CV of a window with an inf) out of the
+            # product, where the zero upper triangle would spread them to earlier years
+            tile = x[rows].astype(_dtype, copy=False)
+            bad = ~np.isfinite(tile)
+            out[rows] = _dot(np.where(bad, 0, tile), W) / norm.astype(_dtype)
+            if bad.any():
+                carry_nonfinite(out[rows], tile)
+    return out.reshape(lcv.shape)
+
+@timed
 def calc_cv(cases, t, ny=10):
 
-    # calculate local coefficient of variation
-    lcv, lcvt = calc_lcv(cases, t, ny=ny)
+    # calculate smoothed local coefficient of variation
+    return calc_cv_batch(cases, t, ny=ny)
 
-    cv = np.zeros(lcv.size)
-    for ix in range(lcv.size):
-        w = calc_weights(ix+1, dx=0)
-        cv[ix] = np.sum(w * lcv[:ix+1]) / np.sum(w)
+@timed
+def calc_canonical_path(cases, pop, t, ny=10, pop_norm=100000, s=3, dx=2, ppy=1):
+    """Calculate the canonical path (CV and weighted mean incidence) for many series at once.
 
-    return cv, lcvt
+    Both metrics are computed from the first year in t, and the mean incidence is
+    trimmed so it lines up with the CV years.
 
-def get_cases_pop(code, inc_df, pop_df, year = np.arange(1974, 2019)):
-    """Retrieve the cases and population from the World Bank and WHO"""
-    cases = [inc_df[inc_df[DataNames.iso] == code][str(y)].values[0] for y in year]
-    pop = [pop_df[pop_df[DataNames.iso] == code][str(y)].values[0] for y in year]
+    Args:
+        cases (ndarray): Case data, shape (..., nt), e.g. (countries, years).
+        pop (ndarray): Population data, same shape as cases.
+        t (ndarray): Time data, shape (nt,).
+        ny (int, optional): Local CV window length. Defaults to 10.
+        pop_norm (int, optional): The normalization factor for the population. Defaults to 100000.
+        s (float, optional): Width of the Gaussian kernels (CV and incidence). Defaults to 3.
+        dx (float, optional): Offset of the incidence kernel, the CV kernel uses dx=0. Defaults to 2.
+        ppy (int, optional): Periods per year, e.g. 12 for monthly data; ny, s and dx stay
+            in years. Defaults to 1.
+
+    Returns:
+        tuple: CV and mean incidence, each of shape (..., nt - ny*ppy + 1), and their time data.
+    """
+    cv, cvt = calc_cv_batch(cases, t, ny=ny, s=s, ppy=ppy)
+    mi, mit = calc_wmi_batch(cases, pop, t, pop_norm=pop_norm, start_year=t[0], s=s, dx=dx, ppy=ppy)
+
+    # trim mi to match cvt
+    mi = mi[..., -cvt.size:]
+    assert mit[-cvt.size] == cvt[0]
+
+    return cv, mi, cvt
+
+@timed
+def get_cases_pop(code, inc_df, pop_df=None, year = np.arange(1974, 2019)):
+    """Retrieve the cases and population from the World Bank and WHO
+
+    inc_df may also be a Panel (pop_df is then ignored), which avoids scanning the
+    DataFrames on every call.
+    """
+    if isinstance(inc_df, Panel):
+        return inc_df.get_cases_pop(code, year=year)
+
+    cols = [str(y) for y in year]
+    cases = inc_df.loc[inc_df[DataNames.iso] == code, cols].to_numpy(dtype=float)[0]
+    pop = pop_df.loc[pop_df[DataNames.iso] == code, cols].to_numpy(dtype=float)[0]
 
     # fill nans with zeros in cases
     cases = np.nan_to_num(cases)
 
-    return np.array(cases), np.array(pop), np.array(year)
+    return cases, pop, np.array(year)
 
-def get_country_code(country):
-    """Get the ISO3 code for a country"""
-    return pycountry.countries.search_fuzzy(country)[0].alpha_3
+def get_country_code(country, resolver=None):
+    """Get the ISO3 code for a country
+
+    Lookups are memoized in a CountryResolver (the shared default one unless given),
+    pycountry's fuzzy search only runs for names it hasn't seen.
+    """
+    return (resolver or default_resolver).resolve(country)
 
 def mi_transform(x):
     """ Non-linear transform for y-axis """
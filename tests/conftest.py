@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# the scripts import their settings module from the scripts folder
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
@@ -0,0 +1,78 @@
+import os
+import sys
+import importlib
+
+import numpy as np
+import pytest
+
+import src
+from src import utils
+from src.synthetic import synthetic_series
+
+
+@pytest.fixture
+def backend():
+    """Restore the backend after the test"""
+    before = utils.get_backend()
+    yield
+    utils.set_backend(before)
+
+
+def run(name, fn, *args, **kwargs):
+    utils.set_backend(name)
+    return fn(*args, **kwargs)
+
+
+@pytest.mark.parametrize("ppy", [1, 12])
+def test_numba_matches_numpy(backend, ppy):
+    pytest.importorskip("numba")
+    cases, pop, t = synthetic_series(40, 45 * ppy, ppy=ppy, seed=3)
+    cases[5, 10:30] = 0
+    cases[6, 12] = np.nan
+    pop[7, 20] = np.nan
+    cases[8, 25 * ppy] = np.inf
+
+    for fn, args, kwargs in (
+        (utils.calc_lcv_batch, (cases, t), dict(ny=10 * ppy)),
+        (utils.calc_cv_batch, (cases, t), dict(ppy=ppy)),
+        (utils.calc_wmi_batch, (cases, pop, t), dict(start_year=t[0], ppy=ppy)),
+    ):
+        with np.errstate(invalid="ignore"):
+            expected, et = run("numpy", fn, *args, **kwargs)
+            got, gt = run("numba", fn, *args, **kwargs)
+        assert got.shape == expected.shape
+        np.testing.assert_allclose(got, expected, rtol=1e-12, atol=1e-15)
+        np.testing.assert_array_equal(gt, et)
+        # values before the infinite count are kept
+        assert np.isfinite(expected[8, :10 * ppy]).all()
+
+
+def test_numba_fallback(backend, monkeypatch):
+    # hide numba (and any compiled kernels already imported)
+    monkeypatch.setitem(sys.modules, "numba", None)
+    monkeypatch.delitem(sys.modules, "src._jit", raising=False)
+    monkeypatch.delattr(src, "_jit", raising=False)
+    with pytest.warns(UserWarning, match="numba is not installed"):
+        assert utils.set_backend("numba") == "numpy"
+    assert utils.get_backend() == "numpy"
+    assert utils.set_backend("auto") == "numpy"
+
+    cases, _, t = synthetic_series(3, 30, seed=1)
+    cv, _ = utils.calc_cv_batch(cases, t)
+    assert np.isfinite(cv).all()
+
+
+def test_jit_threading_layer(monkeypatch):
+    config = pytest.importorskip("numba").config
+
+    monkeypatch.delenv("NUMBA_THREADING_LAYER", raising=False)
+    monkeypatch.setattr(config, "THREADING_LAYER", "default")
+    importlib.reload(importlib.import_module("src._jit"))
+    # fork safe by default, without touching the environment of the process
+    assert config.THREADING_LAYER == "workqueue"
+    assert "NUMBA_THREADING_LAYER" not in os.environ
+
+    # a layer chosen by the caller is kept
+    monkeypatch.setattr(config, "THREADING_LAYER", "omp")
+    importlib.reload(importlib.import_module("src._jit"))
+    assert config.THREADING_LAYER == "omp"
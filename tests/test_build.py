@@ -0,0 +1,24 @@
+import types
+from pathlib import Path
+
+from src import paths, utils
+
+import build
+
+
+def test_manifest_names_are_relative():
+    assert build._name(Path(paths.scripts) / "S1.py") == "scripts/S1.py"
+    assert all(not Path(build._name(f)).is_absolute() for f in build._sources(["S1"]))
+
+
+def test_figure_key_depends_on_dtype_and_backend(monkeypatch):
+    sources = {build._name(f): {"sha256": build._name(f)} for f in build._sources(["S1"])}
+    module = types.SimpleNamespace(PATH_YEARS=(1980, 2019))
+    key = build.figure_key("S1", module, sources)
+    assert build.figure_key("S1", module, sources) == key
+
+    monkeypatch.setattr(utils, "get_dtype", lambda: "float32")
+    assert build.figure_key("S1", module, sources) != key
+    monkeypatch.undo()
+    monkeypatch.setattr(utils, "get_backend", lambda: "numba")
+    assert build.figure_key("S1", module, sources) != key
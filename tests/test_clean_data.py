@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+
+from src import paths
+from src.standards import DataNames
+
+import clean_data
+
+
+def raw_incidence(n=60, years=(1980, 2022), seed=0):
+    """Synthetic WHO long-format file: one row per report, in random order, some repeated"""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for ix in range(n):
+        iso, region = f"C{ix:02d}", ["AFR", "AMR", "EUR"][ix % 3]
+        for year in range(*years):
+            if rng.random() < 0.2:
+                continue
+            for _ in range(rng.integers(1, 3)):
+                rows.append((rng.poisson(100.0), iso, year, region, f"Country {ix}"))
+    df = pd.DataFrame(rows, columns=["Value", "SpatialDimValueCode", "Period", "ParentLocationCode", "Location"])
+    return df.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+
+def pivot_reference(raw, years):
+    """clean_incidence as it was before streaming: pivot_table, then drop out-of-range years"""
+    data = raw.rename(columns={
+        "Value": DataNames.cases,
+        "SpatialDimValueCode": DataNames.iso,
+        "Period": DataNames.year,
+        "ParentLocationCode": DataNames.region,
+    })
+    data = data.pivot_table(
+        index=[DataNames.iso, DataNames.region],
+        columns=DataNames.year,
+        values=DataNames.cases,
+        fill_value=np.nan,
+    ).reset_index()
+    drop = [y for y in data.columns if not isinstance(y, str) and not years[0] <= y <= years[1]]
+    return data.drop(drop, axis=1)
+
+
+def test_clean_incidence_chunked_matches_pivot(tmp_path, monkeypatch):
+    monkeypatch.setattr(paths, "data", str(tmp_path))
+    raw = raw_incidence()
+    raw.to_csv(tmp_path / "raw.csv", index=False)
+    years = (1985, 2020)
+
+    clean_data.clean_incidence("raw.csv", years, chunksize=37)
+    cleaned = pd.read_csv(tmp_path / f"{DataNames.cleaned}_raw.csv")
+
+    expected = pivot_reference(raw, years)
+    expected.to_csv(tmp_path / "expected.csv", index=False)
+    expected = pd.read_csv(tmp_path / "expected.csv")
+
+    assert list(cleaned.columns) == list(expected.columns)
+    pd.testing.assert_frame_equal(cleaned, expected)
+
+
+def test_monthly_cleaned_file_loads(tmp_path, monkeypatch):
+    import calendar
+
+    from src.panel import load_panel
+
+    monkeypatch.setattr(paths, "data", str(tmp_path))
+    rng = np.random.default_rng(1)
+    months = list(calendar.month_name)[1:]
+    rows = [(f"C{ix}", "AFR", year, *rng.poisson(20, 12)) for ix in range(3) for year in range(2010, 2014)]
+    monthly = pd.DataFrame(rows, columns=["ISO3", "Region", "Year", *months])
+    monthly.to_excel(tmp_path / "monthly.xlsx", sheet_name="WEB", index=False)
+
+    # World Bank layout: two lines before the header
+    pop = pd.DataFrame({"Country Name": ["A", "B", "C"], "Country Code": ["C0", "C1", "C2"],
+                        **{str(y): [1e6, 2e6, 3e6] for y in range(2010, 2014)}})
+    with open(tmp_path / "pop.csv", "w") as f:
+        f.write("Data Source,World Development Indicators\nLast Updated Date,2024-06-28\n")
+        pop.to_csv(f, index=False)
+
+    clean_data.clean_incidence_monthly("monthly.xlsx", (2011, 2013))
+    clean_data.clean_population("pop.csv", (2010, 2013))
+    assert (tmp_path / f"{DataNames.cleaned}_monthly.csv").exists()
+
+    panel = load_panel("monthly.xlsx", "pop.csv", ppy=12)
+    assert panel.ppy == 12 and list(panel.isos) == ["C0", "C1", "C2"]
+    assert panel.years.size == 36 and panel.years[0] == 2011
+    first = monthly[(monthly.ISO3 == "C1") & (monthly.Year == 2011)][months].to_numpy()[0]
+    np.testing.assert_array_equal(panel.cases[1, :12], first)
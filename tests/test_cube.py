@@ -0,0 +1,53 @@
+import numpy as np
+
+from src import paths
+from src.cube import GLOBAL, RegionCube, load_cube
+from src.panel import CACHE_DIR, Panel
+from src.synthetic import synthetic_panel, synthetic_series
+
+
+def test_incidence_skips_cases_without_population():
+    cases, pop, t = synthetic_series(6, 30, seed=3)
+    regions = ["AFR", "AFR", "AFR", "EUR", "EUR", "EUR"]
+    # no population for one country in the last years
+    pop[1, -5:] = np.nan
+    panel = Panel([f"S{ix}" for ix in range(6)], t, cases, pop, regions=regions)
+
+    cube = RegionCube.from_panel(panel)
+    cols = panel.columns(cube.years)
+    c, p = cases[:, cols], pop[:, cols]
+    for region, rows in (("AFR", slice(0, 3)), (GLOBAL, slice(None))):
+        ok = np.isfinite(p[rows])
+        expected = 1e5 * np.where(ok, c[rows], 0).sum(axis=0) / np.where(ok, p[rows], 0).sum(axis=0)
+        np.testing.assert_allclose(cube.get("incidence", region)[0], expected, rtol=1e-12)
+        # reported cases still count every country
+        np.testing.assert_allclose(cube.get("cases", region)[0], c[rows].sum(axis=0), rtol=1e-12)
+
+
+def test_load_cube_keyed_on_sources(tmp_path, monkeypatch):
+    monkeypatch.setattr(paths, "data", str(tmp_path))
+    panel = synthetic_panel(12, 30, seed=4)
+    panel.sources = {"cases.csv": "aaa", "pop.csv": "bbb"}
+    cube = load_cube(panel)
+    assert len(list((tmp_path / CACHE_DIR).glob("cube_*.npz"))) == 1
+
+    # the arrays are not read to find the cached cube
+    monkeypatch.setattr(np, "ascontiguousarray", None)
+    np.testing.assert_array_equal(load_cube(panel).get("incidence"), cube.get("incidence"))
+    monkeypatch.undo()
+    monkeypatch.setattr(paths, "data", str(tmp_path))
+
+    # new sources or parameters give a new cube
+    panel.sources = {"cases.csv": "ccc", "pop.csv": "bbb"}
+    load_cube(panel)
+    load_cube(panel, ny=5)
+    assert len(list((tmp_path / CACHE_DIR).glob("cube_*.npz"))) == 3
+
+
+def test_load_cube_without_sources(tmp_path, monkeypatch):
+    monkeypatch.setattr(paths, "data", str(tmp_path))
+    panel = synthetic_panel(12, 30, seed=4)
+    assert panel.sources is None
+    cube = load_cube(panel)
+    panel.cases[0, -1] += 1000
+    assert not np.array_equal(load_cube(panel).get("cases"), cube.get("cases"))
@@ -0,0 +1,39 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from settings import Settings
+
+from src import utils
+from src.incremental import IncrementalPath
+from src.panel import load_panel
+
+
+@pytest.fixture(scope="module")
+def panel_data():
+    panel = load_panel(cases=Settings.cases, population=Settings.population)
+    cols = panel.columns(np.arange(1974, 2023))
+    return np.array(panel.cases[:, cols]), np.array(panel.pop[:, cols]), panel.years[cols]
+
+
+@pytest.mark.parametrize("split", [5, 25])
+def test_extend_matches_canonical_path(panel_data, split):
+    cases, pop, t = panel_data
+    ny = 10
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cv_ref, mi_ref, cvt = utils.calc_canonical_path(cases, pop, t, ny=ny)
+
+        path = IncrementalPath(len(cases), ny=ny)
+        cv0, mi0 = path.extend(cases[:, :split], pop[:, :split], t[:split])
+        # the running state survives a round trip, e.g. between yearly runs
+        path = pickle.loads(pickle.dumps(path))
+        cv1, mi1 = path.extend(cases[:, split:], pop[:, split:], t[split:])
+
+    cv, mi = np.concatenate([cv0, cv1], axis=1), np.concatenate([mi0, mi1], axis=1)
+    assert path.t == list(t)
+    assert np.isnan(cv[:, :ny - 1]).all()
+    np.testing.assert_array_equal(t[ny - 1:], cvt)
+    # measured differences: 1.3e-15 absolute for CV and 2.8e-15 relative for MI
+    np.testing.assert_allclose(cv[:, ny - 1:], cv_ref, rtol=1e-12, atol=1e-13)
+    np.testing.assert_allclose(mi[:, ny - 1:], mi_ref, rtol=1e-12, atol=1e-13)
@@ -0,0 +1,95 @@
+import os
+import json
+
+import numpy as np
+import pytest
+
+from src import panel as panel_mod
+from src.panel import CURRENT, Panel, _cache_state, _write_cache, load_cache
+from src.synthetic import synthetic_panel
+
+
+def versions(cache_dir):
+    return sorted(p.name for p in cache_dir.iterdir() if p.is_dir())
+
+
+def test_write_cache_swaps_versions(tmp_path, monkeypatch):
+    cache_dir = tmp_path / "panel_x"
+    with pytest.raises(FileNotFoundError):
+        load_cache(cache_dir)
+    first = _write_cache(cache_dir, synthetic_panel(5, 10, seed=1), {"a": {"sha256": "1"}})
+    before = load_cache(cache_dir)
+
+    # the only change readers see is the pointer, replaced once the new version is complete
+    swaps = []
+    replace = os.replace
+
+    def watch(src, dst):
+        if os.fspath(dst) == os.fspath(cache_dir / CURRENT):
+            with open(src) as f:
+                version = cache_dir / f.read()
+            swaps.append(sorted(p.name for p in version.iterdir()))
+        replace(src, dst)
+
+    monkeypatch.setattr(panel_mod.os, "replace", watch)
+    new = synthetic_panel(6, 10, seed=2)
+    second = _write_cache(cache_dir, new, {"a": {"sha256": "2"}})
+
+    assert swaps == [["cases.npy", "labels.json", "pop.npy", "sources.json", "years.npy"]]
+    np.testing.assert_array_equal(load_cache(cache_dir).cases, new.cases)
+    with open(second / "sources.json") as f:
+        assert json.load(f) == {"a": {"sha256": "2"}}
+
+    # the version replaced stays readable, older ones are removed
+    assert versions(cache_dir) == sorted([first.name, second.name])
+    np.testing.assert_array_equal(before.cases, synthetic_panel(5, 10, seed=1).cases)
+    third = _write_cache(cache_dir, new, {"a": {"sha256": "3"}})
+    assert versions(cache_dir) == sorted([second.name, third.name])
+    assert not list(cache_dir.glob("*.tmp"))
+
+
+def test_write_cache_replaces_unversioned_cache(tmp_path):
+    cache_dir = tmp_path / "panel_x"
+    old = synthetic_panel(3, 5)
+    old.save(cache_dir)
+    with open(cache_dir / "sources.json", "w") as f:
+        json.dump({"a": {"sha256": "1"}}, f)
+    assert not _cache_state(cache_dir, {})[0]
+
+    version = _write_cache(cache_dir, synthetic_panel(4, 5), {})
+    assert sorted(p.name for p in cache_dir.iterdir()) == sorted([CURRENT, version.name])
+    assert len(load_cache(cache_dir)) == 4
+
+
+def test_cache_state_refreshes_mtimes(tmp_path):
+    source = tmp_path / "cases.csv"
+    source.write_text("a,b\n1,2\n")
+    sources = {"cases": str(source)}
+    cache_dir = tmp_path / "panel_x"
+
+    fresh, info = _cache_state(cache_dir, sources)
+    assert not fresh
+    version = _write_cache(cache_dir, synthetic_panel(2, 5), info)
+    assert _cache_state(cache_dir, sources)[0]
+
+    # touched but unchanged: still fresh, and the stored mtime follows the file
+    stat = os.stat(source)
+    os.utime(source, (stat.st_atime, stat.st_mtime + 10))
+    fresh, info = _cache_state(cache_dir, sources)
+    assert fresh
+    with open(version / "sources.json") as f:
+        assert json.load(f) == info
+    assert sorted(p.name for p in version.iterdir()) == \
+        ["cases.npy", "labels.json", "pop.npy", "sources.json", "years.npy"]
+
+    source.write_text("a,b\n1,3\n")
+    assert not _cache_state(cache_dir, sources)[0]
+
+
+def test_cached_panel_records_sources(tmp_path):
+    cache_dir = tmp_path / "panel_x"
+    info = {"cases.csv": {"mtime": 1.0, "size": 2, "sha256": "abc"}}
+    version = _write_cache(cache_dir, synthetic_panel(2, 5), info)
+    assert Panel.load(version).sources == {"cases.csv": "abc"}
+    assert load_cache(cache_dir).sources == {"cases.csv": "abc"}
+    assert synthetic_panel(2, 5).sources is None
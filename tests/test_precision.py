@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from settings import Settings
+
+from src import utils
+from src.panel import load_panel
+
+# float32 against float64 on the WHO panel: max relative error measured at 1.1e-5 (mean
+# incidence above 1e-6 per 100k), smaller values are off by less than 1e-11 absolute
+RTOL32, ATOL32 = 2e-5, 1e-10
+
+
+@pytest.fixture(scope="module")
+def panel_data():
+    panel = load_panel(cases=Settings.cases, population=Settings.population)
+    cols = panel.columns(np.arange(1974, 2023))
+    return np.array(panel.cases[:, cols]), np.array(panel.pop[:, cols]), panel.years[cols]
+
+
+@pytest.fixture
+def policy():
+    """Restore the dtype and memory budget after the test"""
+    dtype, budget = utils.get_dtype(), utils.get_memory_budget()
+    yield
+    utils.set_dtype(dtype)
+    utils.set_memory_budget(budget)
+
+
+def canonical(cases, pop, t, dtype="float64", budget=None, **kwargs):
+    utils.set_dtype(dtype)
+    utils.set_memory_budget(budget)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return utils.calc_canonical_path(cases, pop, t, **kwargs)
+
+
+def test_float32_matches_float64(panel_data, policy):
+    cv, mi, t = canonical(*panel_data)
+    cv32, mi32, t32 = canonical(*panel_data, dtype="float32")
+    assert cv32.dtype == mi32.dtype == np.float32
+    np.testing.assert_array_equal(t32, t)
+    np.testing.assert_allclose(cv32, cv, rtol=RTOL32, atol=ATOL32)
+    np.testing.assert_allclose(mi32, mi, rtol=RTOL32, atol=ATOL32)
+
+
+def test_float32_monthly_matches_float64(policy):
+    from src.synthetic import synthetic_series
+
+    cases, pop, t = synthetic_series(50, 40 * 12, ppy=12, seed=2)
+    cv, mi, _ = canonical(cases, pop, t, ppy=12)
+    cv32, mi32, _ = canonical(cases, pop, t, dtype="float32", ppy=12)
+    np.testing.assert_allclose(cv32, cv, rtol=RTOL32, atol=ATOL32)
+    np.testing.assert_allclose(mi32, mi, rtol=RTOL32, atol=ATOL32)
+
+
+@pytest.mark.parametrize("dtype", ["float64", "float32"])
+@pytest.mark.parametrize("budget", ["64K", 4096, 1])
+def test_tiled_matches_untiled(panel_data, policy, dtype, budget):
+    cv, mi, t = canonical(*panel_data, dtype=dtype)
+    cvb, mib, tb = canonical(*panel_data, dtype=dtype, budget=budget)
+    np.testing.assert_array_equal(tb, t)
+    # tiles only change how many rows go through each matrix product
+    np.testing.assert_allclose(cvb, cv, rtol=1e-12 if dtype == "float64" else 1e-6)
+    np.testing.assert_allclose(mib, mi, rtol=1e-12 if dtype == "float64" else 1e-6)
+
+
+def test_memory_budget_parsing(policy):
+    assert utils.set_memory_budget("512M") == 512 << 20
+    assert utils.set_memory_budget("1.5g") == 3 << 29
+    assert utils.set_memory_budget(1000) == 1000
+    assert utils.set_memory_budget(None) is None
+    assert len(utils.row_tiles(10, 1)) == 1
+    utils.set_memory_budget(250)
+    assert utils.row_tiles(10, 100) == [slice(r, r + 2) for r in range(0, 10, 2)]
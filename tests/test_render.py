@@ -0,0 +1,24 @@
+import numpy as np
+import matplotlib
+import matplotlib.pyplot as plt
+
+from src import render
+
+
+def test_render_page_leaves_pyplot_alone(tmp_path):
+    x = np.tile(np.linspace(0, 1, 10), (4, 1))
+    y = x ** 2
+    backend = matplotlib.get_backend()
+    plt.close("all")
+    plt.switch_backend("svg")
+    fig = plt.figure()
+    try:
+        for ext in ("png", "svg"):
+            out = render.render_page(str(tmp_path / f"page.{ext}"), x, y, titles=list("abcd"), shape=(2, 2))
+            assert (tmp_path / f"page.{ext}").stat().st_size > 0
+            assert out == str(tmp_path / f"page.{ext}")
+        assert matplotlib.get_backend() == "svg"
+        assert plt.get_fignums() == [fig.number]
+    finally:
+        plt.close("all")
+        plt.switch_backend(backend)
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from src import similarity
+from src.similarity import KDTree, TrajectoryIndex
+from src.synthetic import synthetic_panel
+
+
+def knn_loop(data, x, k):
+    """Reference: full sort of the distances to every point"""
+    d = np.sqrt(((data[None] - x[:, None]) ** 2).sum(axis=-1))
+    i = np.argsort(d, axis=1, kind="stable")[:, :k]
+    return np.take_along_axis(d, i, axis=1), i
+
+
+@pytest.fixture
+def points():
+    rng = np.random.default_rng(3)
+    data = rng.normal(size=(300, 20))
+    # duplicates and a far cluster
+    data[10:15] = data[0]
+    data[-20:] += 50
+    return data, np.vstack([data[:40], rng.normal(size=(10, 20))])
+
+
+@pytest.mark.parametrize("k", [1, 6, 300])
+def test_kdtree_query(points, k):
+    data, x = points
+    d, i = KDTree(data, leaf_size=8).query(x, k=k)
+    d_ref, i_ref = knn_loop(data, x, k)
+    np.testing.assert_array_equal(i, i_ref)
+    np.testing.assert_allclose(d, d_ref, rtol=1e-12, atol=1e-12)
+
+
+def test_kdtree_missing_neighbours(points):
+    data, x = points
+    d, i = KDTree(data[:4], leaf_size=2).query(x[:2], k=6)
+    assert d.shape == i.shape == (2, 6)
+    assert np.isinf(d[:, 4:]).all() and (i[:, 4:] == 4).all()
+    np.testing.assert_array_equal(np.sort(i[:, :4], axis=1), np.tile(np.arange(4), (2, 1)))
+
+
+@pytest.mark.parametrize("r", [0.0, 4.0, 6.0])
+def test_kdtree_ball(points, r):
+    data, x = points
+    d = np.sqrt(((data[None] - x[:, None]) ** 2).sum(axis=-1))
+    found = KDTree(data, leaf_size=8).query_ball_point(x, r)
+    assert found == [np.flatnonzero(row <= r).tolist() for row in d]
+
+
+def test_kdtree_reads_few_leaves(monkeypatch):
+    # clustered points: a query only needs the leaves of its own cluster
+    rng = np.random.default_rng(4)
+    centers = rng.uniform(-100, 100, size=(50, 4))
+    data = (centers[:, None] + rng.normal(size=(50, 200, 4))).reshape(-1, 4)
+    tree = KDTree(data, leaf_size=32)
+    read = []
+    leaf = tree._leaf
+    monkeypatch.setattr(tree, "_leaf", lambda node, x: read.append(node) or leaf(node, x))
+    d, i = tree.query(data[:20], k=5)
+    d_ref, i_ref = knn_loop(data, data[:20], 5)
+    np.testing.assert_array_equal(i, i_ref)
+    assert len(read) * tree.leaf_size < 0.1 * 20 * len(data)
+
+
+def test_index_without_scipy(monkeypatch):
+    monkeypatch.setattr(similarity, "cKDTree", None)
+    check_index(KDTree)
+
+
+def test_index_with_scipy():
+    spatial = pytest.importorskip("scipy.spatial")
+    check_index(spatial.cKDTree)
+
+
+def check_index(backend):
+    panel = synthetic_panel(40, 30, seed=5)
+    index = TrajectoryIndex.from_panel(panel, years=15, points=5, leaf_size=4)
+    assert isinstance(index.tree, backend)
+
+    vectors = index.vectors[index.valid]
+    d_ref, i_ref = knn_loop(vectors, vectors[:1], 4)
+    label = index.labels[index.valid[0]]
+    assert [lab for lab, _ in index.similar(label, k=3)] == list(index.labels[index.valid[i_ref[0, 1:]]])
+    assert set(index.within(label, d_ref[0, -1])) >= set(index.labels[index.valid[i_ref[0, 1:]]])
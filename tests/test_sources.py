@@ -0,0 +1,79 @@
+import datetime
+
+import numpy as np
+import pytest
+
+from src import paths, sources
+from src.sources import find_snapshots, load_snapshot, load_snapshots, read_table, register_reader
+from src.synthetic import synthetic_dataframes
+
+
+@pytest.fixture
+def root(tmp_path, monkeypatch):
+    """Two snapshots, a folder that is not a date and one missing its population table"""
+    monkeypatch.setattr(paths, "data", str(tmp_path))
+    root = tmp_path / "snapshots"
+    for date, seed in (("2023-07-15", 1), ("2024-07-12", 2)):
+        inc_df, pop_df = synthetic_dataframes(5, 20, seed=seed)
+        (root / date).mkdir(parents=True)
+        inc_df.to_csv(root / date / "cleaned_measlescasedata.csv", index=False)
+        pop_df.to_csv(root / date / "cleaned_pop.csv", index=False)
+    (root / "2024-07-12" / "cases_notes.txt").write_text("not a table")
+    (root / "latest").mkdir()
+    (root / "2025-01-01").mkdir()
+    inc_df.to_csv(root / "2025-01-01" / "cleaned_measlescasedata.csv", index=False)
+    return root
+
+
+def test_read_table_by_suffix(tmp_path):
+    inc_df, _ = synthetic_dataframes(3, 5)
+    inc_df.to_csv(tmp_path / "a.csv.gz", index=False)
+    assert sources._suffix(tmp_path / "a.csv.gz") == ".csv.gz"
+    assert list(read_table(tmp_path / "a.csv.gz").columns) == [str(c) for c in inc_df.columns]
+
+    with pytest.raises(ValueError, match="no reader registered"):
+        read_table(tmp_path / "a.json")
+
+
+def test_register_reader(tmp_path, monkeypatch):
+    monkeypatch.setattr(sources, "READERS", dict(sources.READERS))
+    inc_df, _ = synthetic_dataframes(3, 5)
+
+    @register_reader(".tsv")
+    def read_tsv(filename):
+        import pandas as pd
+        return pd.read_csv(filename, sep="\t")
+
+    inc_df.to_csv(tmp_path / "a.tsv", sep="\t", index=False)
+    assert read_table(tmp_path / "a.tsv").shape == inc_df.shape
+
+
+def test_find_snapshots(root):
+    found = find_snapshots()
+    assert list(found) == [datetime.date(2023, 7, 15), datetime.date(2024, 7, 12)]
+    # files without a registered reader are not matched
+    files = found[datetime.date(2024, 7, 12)]
+    assert files["cases"].name == "cleaned_measlescasedata.csv"
+    assert files["population"].name == "cleaned_pop.csv"
+    assert find_snapshots(root, cases="*nothing*") == {}
+
+
+def test_load_snapshots_uses_cache(root, monkeypatch):
+    panels = load_snapshots(root)
+    assert list(panels) == [datetime.date(2023, 7, 15), datetime.date(2024, 7, 12)]
+    inc_df, _ = synthetic_dataframes(5, 20, seed=2)
+    np.testing.assert_array_equal(panels[datetime.date(2024, 7, 12)].cases,
+                                  inc_df.iloc[:, 2:].to_numpy(dtype=float))
+
+    # unchanged snapshots come from the cache without being read
+    monkeypatch.setattr(sources, "read_table", None)
+    panel = load_snapshot("2023-07-15", root)
+    np.testing.assert_array_equal(panel.cases, panels[datetime.date(2023, 7, 15)].cases)
+
+
+def test_load_snapshot_unknown_date(root):
+    with pytest.raises(KeyError, match="no snapshot 2020-01-01"):
+        load_snapshot("2020-01-01", root)
+    # a folder without both tables is not a snapshot
+    with pytest.raises(KeyError):
+        load_snapshot("2025-01-01", root)
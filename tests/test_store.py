@@ -0,0 +1,107 @@
+import numpy as np
+
+from src.standards import DataNames
+from src.store import ResultsStore
+from src.synthetic import synthetic_panel
+
+
+def columns(n=40, seed=0, start=1990):
+    rng = np.random.default_rng(seed)
+    return {
+        DataNames.iso: np.array([f"C{ix % 4}" for ix in range(n)]),
+        DataNames.region: np.array(["AFR" if ix % 4 < 2 else "EUR" for ix in range(n)]),
+        DataNames.year: start + np.arange(n) // 4.0,
+        DataNames.cv: rng.random(n),
+        DataNames.mi: rng.random(n),
+    }
+
+
+def test_append_query_roundtrip(tmp_path):
+    store = ResultsStore(tmp_path)
+    data = columns()
+    store.append(data, {"ny": 10}, chunk_rows=8)
+    assert len(store) == 40 and len(store.meta["chunks"]) == 5
+
+    out = store.query(param={"ny": 10}, as_frame=False)
+    order = np.lexsort((out[DataNames.iso], out[DataNames.year]))
+    expected = np.lexsort((data[DataNames.iso], data[DataNames.year]))
+    for column in (DataNames.iso, DataNames.region, DataNames.year, DataNames.cv, DataNames.mi):
+        np.testing.assert_array_equal(out[column][order], data[column][expected])
+
+    rows = store.query(region="AFR", where=[(DataNames.cv, ">", 0.5)])
+    keep = (data[DataNames.region] == "AFR") & (data[DataNames.cv] > 0.5)
+    assert len(rows) == keep.sum()
+    np.testing.assert_allclose(np.sort(rows[DataNames.cv]), np.sort(data[DataNames.cv][keep]))
+    assert len(store.query(param={"ny": 3})) == 0
+
+
+def test_append_replaces_parameter_set(tmp_path):
+    store = ResultsStore(tmp_path)
+    store.append(columns(seed=0), {"ny": 10}, chunk_rows=8)
+    store.append(columns(seed=1), {"ny": 5}, chunk_rows=8)
+    old = {c["name"] for c in store.meta["chunks"] if c["param"] == 0}
+
+    data = columns(n=12, seed=2)
+    store.append(data, {"ny": 10}, chunk_rows=8)
+    assert len(store.params) == 2 and len(store) == 40 + 12
+    assert not any((tmp_path / name).exists() for name in old)
+    np.testing.assert_allclose(np.sort(store.query(param=0)[DataNames.cv]), np.sort(data[DataNames.cv]))
+    assert len(store.query(param={"ny": 5})) == 40
+
+
+def test_zone_maps_prune_chunks(tmp_path):
+    store = ResultsStore(tmp_path)
+    # chunks of 8 rows cover two years each: 1990-1991, ..., 1998-1999
+    store.append(columns(), {"ny": 10}, chunk_rows=8)
+    names = [c["name"] for c in store.meta["chunks"]]
+    assert store.chunks(year=1994) == names[2:3]
+    assert store.chunks(where=[(DataNames.year, ">=", 1996)]) == names[3:]
+    assert store.chunks(where=[(DataNames.year, "<", 1990)]) == []
+    assert store.chunks(year=[1990, 1999]) == [names[0], names[-1]]
+    assert store.chunks(**{DataNames.iso: "C9"}) == []
+
+
+def test_all_nan_zone(tmp_path):
+    store = ResultsStore(tmp_path)
+    data = columns(n=16)
+    data[DataNames.cv][:8] = np.nan
+    store.append(data, {"ny": 10}, chunk_rows=8)
+    first, second = store.meta["chunks"]
+    assert first["zone"][DataNames.cv] == [None, None]
+    assert store.chunks(where=[(DataNames.cv, ">", -1)]) == [second["name"]]
+    assert store.chunks(where=[(DataNames.cv, "!=", 2)]) == [first["name"], second["name"]]
+    assert len(store.query(where=[(DataNames.cv, ">=", 0)])) == 8
+
+
+def test_category_in_with_unknown_labels(tmp_path):
+    store = ResultsStore(tmp_path)
+    store.append(columns(), {"ny": 10}, chunk_rows=8)
+    assert store.chunks(**{DataNames.region: ["SEAR", "WPR"]}) == []
+    assert len(store.query(region=["SEAR", "WPR"])) == 0
+    rows = store.query(iso=["C1", "XXX"])
+    assert set(rows[DataNames.iso]) == {"C1"} and len(rows) == 10
+    # unknown labels are not added to the categories
+    assert store.meta["categories"][DataNames.region] == ["AFR", "EUR"]
+
+
+def test_reopen_from_meta(tmp_path):
+    store = ResultsStore(tmp_path)
+    store.append(columns(), {"ny": 10, "s": np.int64(3)}, chunk_rows=8)
+
+    again = ResultsStore(tmp_path)
+    assert again.params == [{"ny": 10, "s": 3}] and len(again) == 40
+    assert again.param_id({"ny": 10, "s": 3}) == 0
+    assert again.query(iso="C2", year=1995).equals(store.query(iso="C2", year=1995))
+    # new labels extend the categories read from meta.json
+    again.append(columns(n=4, start=2000) | {DataNames.iso: np.array(["C0", "C1", "C2", "NEW"])}, {"ny": 5})
+    assert again.meta["categories"][DataNames.iso] == ["C0", "C1", "C2", "C3", "NEW"]
+    assert set(again.query(param=1)[DataNames.iso]) == {"C0", "C1", "C2", "NEW"}
+
+
+def test_write_path_keys_year_range(tmp_path):
+    store = ResultsStore(tmp_path)
+    panel = synthetic_panel(5, 30, seed=1)
+    store.write_path(panel, year=np.arange(1980, 2000))
+    store.write_path(panel, year=np.arange(1980, 1995))
+    assert [(p["start_year"], p["end_year"]) for p in store.params] == [(1980, 1999), (1980, 1994)]
+    assert len(store.query(param=0)) > len(store.query(param=1)) > 0
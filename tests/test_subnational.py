@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from src.subnational import LocationPanel
+
+
+@pytest.fixture
+def panel():
+    keys = [("NGA", "Kano"), ("NGA", "Lagos"), ("GHA", "Ashanti"), ("NGA", "Oyo")]
+    rng = np.random.default_rng(0)
+    cases = rng.poisson(50, size=(4, 12)).astype(float)
+    pop = np.full((4, 12), 1e6)
+    return LocationPanel(keys, np.arange(2000, 2012), cases, pop)
+
+
+def test_rows_by_key_and_iso(panel):
+    assert panel.rows(("NGA", "Lagos")) == 1
+    np.testing.assert_array_equal(panel.rows("NGA"), [0, 1, 3])
+    np.testing.assert_array_equal(panel.rows(["GHA", ("NGA", "Oyo")]), [2, 3])
+    np.testing.assert_array_equal(panel.rows([]), [])
+    with pytest.raises(KeyError, match="XYZ"):
+        panel.rows("XYZ")
+
+
+def test_get_cases_pop_by_iso(panel):
+    cases, pop, t = panel.get_cases_pop("NGA", year=np.arange(2002, 2006))
+    np.testing.assert_array_equal(cases, panel.cases[[0, 1, 3], 2:6])
+    np.testing.assert_array_equal(t, np.arange(2002, 2006))
+
+    cases, _, _ = panel.get_cases_pop(("GHA", "Ashanti"))
+    np.testing.assert_array_equal(cases, panel.cases[2])
+
+
+def test_row_of_country_level_panel(panel):
+    country = panel.rollup(1)
+    cases, _ = country.row("NGA")
+    np.testing.assert_array_equal(cases, panel.cases[[0, 1, 3]].sum(axis=0))
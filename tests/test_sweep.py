@@ -0,0 +1,16 @@
+import pandas as pd
+
+from src.sweep import parameter_grid, run_point, run_sweep
+from src.synthetic import synthetic_panel
+
+
+def test_run_sweep_matches_run_point_monthly(tmp_path):
+    panel = synthetic_panel(6, 20 * 12, ppy=12, start_year=1990)
+    grid = parameter_grid(s=(2, 3), ny=(5,), start_year=(1992,))
+
+    out = pd.read_csv(run_sweep(panel, grid, str(tmp_path / "sweep.csv"), max_workers=2))
+    for point, params in enumerate(grid):
+        got = out[out["point"] == point].drop(columns="point").reset_index(drop=True)
+        expected = run_point(panel, params)
+        assert len(got) == len(expected)
+        pd.testing.assert_frame_equal(got, expected, check_dtype=False)
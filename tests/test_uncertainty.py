@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+
+from src import utils
+from src.canonical import canonical_path
+from src.synthetic import synthetic_panel, synthetic_series
+from src.uncertainty import QuantileSketch, bootstrap_cv, under_reporting_path
+
+
+@pytest.fixture
+def budget():
+    old = utils.get_memory_budget()
+    yield utils.set_memory_budget
+    utils.set_memory_budget(old)
+
+
+@pytest.mark.parametrize("method", ["poisson", "block"])
+def test_bootstrap_cv_ignores_memory_budget(budget, method):
+    cases, _, t = synthetic_series(12, 30, seed=4)
+    budget(None)
+    cv, lcv, cvt = bootstrap_cv(cases, t, n_boot=50, method=method, seed=1)
+    # small enough for one series per tile
+    budget(50 * 30 * 8)
+    assert len(utils.row_tiles(len(cases), 50 * 30 * 8)) == len(cases)
+    cv_t, lcv_t, cvt_t = bootstrap_cv(cases, t, n_boot=50, method=method, seed=1)
+    np.testing.assert_allclose(cv_t, cv, rtol=1e-12)
+    np.testing.assert_allclose(lcv_t, lcv, rtol=1e-12)
+    np.testing.assert_array_equal(cvt_t, cvt)
+    # a series' intervals do not depend on the series around it
+    cv_1, _, _ = bootstrap_cv(cases[:3], t, n_boot=50, method=method, seed=1)
+    np.testing.assert_allclose(cv_1, cv[:, :3], rtol=1e-12)
+
+
+def test_quantile_sketch_exact_up_to_capacity():
+    rng = np.random.default_rng(0)
+    quantiles = [0, 0.05, 0.5, 0.95, 1]
+    x = rng.lognormal(0, 1, size=(1000, 50))
+    est = QuantileSketch(quantiles, x.shape[1:], capacity=1024)
+    est.update(x[:7])
+    est.add(x[7])
+    est.update(x[8:])
+    assert est.count == 1000
+    np.testing.assert_array_equal(est.result(), np.quantile(x, quantiles, axis=0))
+
+
+@pytest.mark.parametrize("capacity", [128, 1024])
+def test_quantile_sketch_rank_error(capacity):
+    rng = np.random.default_rng(1)
+    quantiles = np.array([0.05, 0.5, 0.95])
+    x = rng.lognormal(0, 1, size=(20000, 200))
+    est = QuantileSketch(quantiles, x.shape[1:], capacity=capacity)
+    for chunk in np.array_split(x, 200):
+        est.update(chunk)
+
+    # fraction of the observations below each estimate, against the quantile
+    rank = (x[None] < est.result()[:, None]).mean(axis=1)
+    bound = np.log2(len(x) / capacity) / capacity
+    assert np.abs(rank - quantiles[:, None]).max() < bound
+    # memory grows with the log of the count
+    assert sum(len(b) for b in est._levels) <= capacity * np.log2(len(x))
+
+
+def test_quantile_sketch_merge_and_nan():
+    rng = np.random.default_rng(2)
+    x = rng.normal(size=(600, 3))
+    x[100, 2] = np.nan
+    a, b = QuantileSketch([0.5], (3,), capacity=64), QuantileSketch([0.5], (3,), capacity=64)
+    a.update(x[:250])
+    b.update(x[250:])
+    a.merge(b)
+    assert a.count == 600
+    got = a.result()
+    assert np.isnan(got[0, 2])
+    rank = (x[:, :2] < got[0, :2]).mean(axis=0)
+    assert np.abs(rank - 0.5).max() < 0.05
+
+    exact = QuantileSketch([0.5], (3,))
+    exact.update(x[:10])
+    assert np.isnan(QuantileSketch([0.5], (3,)).result()).all()
+    np.testing.assert_array_equal(exact.result()[0], np.median(x[:10], axis=0))
+
+
+def test_under_reporting_path_workers():
+    panel = synthetic_panel(8, 30, seed=6)
+    kwargs = dict(n_samples=120, chunk_size=25, seed=3, year=np.arange(1980, 2004))
+    bands, t = under_reporting_path(panel, max_workers=1, **kwargs)
+    bands2, t2 = under_reporting_path(panel, max_workers=2, **kwargs)
+    assert bands.shape == (3, 8, t.size, 2)
+    np.testing.assert_array_equal(bands2, bands)
+    np.testing.assert_array_equal(t2, t)
+
+
+def test_under_reporting_path_without_error():
+    # everything reported and exact populations: every sample is the canonical path
+    panel = synthetic_panel(8, 30, seed=6)
+    year = np.arange(1980, 2004)
+    bands, t = under_reporting_path(panel, n_samples=20, chunk_size=8, reporting=(1.0, 1.0),
+                                    pop_sd=0.0, year=year)
+    path, pt = canonical_path(panel, year=year)
+    np.testing.assert_array_equal(t, pt)
+    for band in bands:
+        np.testing.assert_allclose(band, path, rtol=1e-12)
@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+
+from src import utils
+
+
+# the loops the batch engines replaced, kept as references
+
+
+def calc_wmi_loop(cases, pop, t, pop_norm=100000, start_year=1980):
+    mi = np.zeros(t.max() - start_year + 1)
+    ii = np.where(t == start_year)[0][0]
+    for ix in range(1, len(mi) + 1):
+        weights = utils.calc_weights(ix)
+        mi[ix-1] = pop_norm * np.sum(weights * cases[ii:(ii+ix)] / pop[ii:(ii+ix)]) / np.sum(weights)
+    return mi, t[ii:]
+
+
+def calc_wcv_loop(x, w):
+    wm = np.sum(w * x) / np.sum(w)
+    num = np.sum(w * (x - wm) ** 2)
+    den = np.sum(w)
+    if wm > 0:
+        return np.sqrt(num / den) / wm
+    return 0
+
+
+def calc_lcv_loop(cases, time, ny=10):
+    w = np.ones(ny)
+    wcv = np.zeros(len(cases) - ny + 1)
+    for ix in range(len(wcv)):
+        wcv[ix] = calc_wcv_loop(cases[ix:(ix+ny)], w)
+    return wcv, time[ny-1:]
+
+
+def calc_cv_loop(cases, t, ny=10):
+    lcv, lcvt = calc_lcv_loop(cases, t, ny=ny)
+    cv = np.zeros(lcv.size)
+    for ix in range(lcv.size):
+        w = utils.calc_weights(ix+1, dx=0)
+        cv[ix] = np.sum(w * lcv[:ix+1]) / np.sum(w)
+    return cv, lcvt
+
+
+def series(n=9, nt=45, seed=0):
+    """Case and population rows with gaps, zero stretches and missing values"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(1974, 1974 + nt)
+    cases = rng.poisson(rng.uniform(5, 5000, size=(n, 1)), size=(n, nt)).astype(float)
+    pop = rng.uniform(1e5, 1e8, size=(n, 1)) * np.linspace(1, 1.8, nt)
+    cases[1, 10:25] = 0            # all-zero windows (the wm > 0 guard)
+    cases[2, :] = 0
+    cases[3, 20] = np.nan          # a missing report
+    cases[4, 30:] = np.nan
+    cases[8, 30] = np.inf          # an infinite count: NaN local CV from then on
+    return cases, pop, t
+
+
+@pytest.mark.parametrize("ny", [3, 10])
+def test_calc_lcv_batch_matches_loop(ny):
+    cases, _, t = series()
+    with np.errstate(invalid="ignore"):
+        lcv, lcvt = utils.calc_lcv_batch(cases, t, ny=ny)
+        for row, got in zip(cases, lcv):
+            expected, et = calc_lcv_loop(row, t, ny=ny)
+            np.testing.assert_allclose(got, expected, rtol=1e-12, atol=0)
+            np.testing.assert_array_equal(lcvt, et)
+    # windows with a NaN fail the wm > 0 guard and give 0, like all-zero windows
+    assert (lcv[1, 10:25 - ny + 1] == 0).all() and (lcv[2] == 0).all()
+    assert (lcv[3, 20 - ny + 1:21] == 0).all()
+
+
+@pytest.mark.parametrize("ny", [3, 10])
+def test_calc_cv_batch_matches_loop(ny):
+    cases, _, t = series()
+    with np.errstate(invalid="ignore"):
+        cv, cvt = utils.calc_cv_batch(cases, t, ny=ny)
+        for row, got in zip(cases, cv):
+            expected, et = calc_cv_loop(row, t, ny=ny)
+            np.testing.assert_allclose(got, expected, rtol=1e-12, atol=1e-15)
+            np.testing.assert_array_equal(cvt, et)
+    # the years before the infinite count keep their values
+    assert np.isfinite(cv[8, :30 - ny + 1]).all() and np.isnan(cv[8, 30 - ny + 1:]).all()
+
+
+def test_calc_wmi_batch_matches_loop():
+    cases, pop, t = series()
+    pop[5, 25] = 0                 # zero population: inf from then on
+    pop[6, 25] = np.nan            # missing population: NaN from then on
+    cases[7, 25], pop[7, 25] = 0, 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mi, mit = utils.calc_wmi_batch(cases, pop, t, start_year=1980)
+        for c, p, got in zip(cases, pop, mi):
+            expected, et = calc_wmi_loop(c, p, t, start_year=1980)
+            np.testing.assert_allclose(got, expected, rtol=1e-12)
+            np.testing.assert_array_equal(mit, et)
+    assert np.isposinf(mi[5, 19:]).all() and np.isnan(mi[6, 19:]).all() and np.isnan(mi[7, 19:]).all()